@@ -0,0 +1,76 @@
+# benchmarks/bench_startup.py
+# Banc d'essai du démarrage à froid : chaque mesure est un nouveau processus Python, avec un dossier de données isolé.
+#   python benchmarks/bench_startup.py --runs 10 --files 200 --max-import-ms 150
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import fitz  # PyMuPDF
+
+def isolated_env(home):
+    # Données et configuration de l'application dans home : le premier lancement est réellement un premier lancement
+    env = dict(os.environ, HOME=home, XDG_DATA_HOME=os.path.join(home, "data"), XDG_STATE_HOME=os.path.join(home, "state"),
+               XDG_CACHE_HOME=os.path.join(home, "cache"), APPDATA=home, LOCALAPPDATA=home, QT_QPA_PLATFORM="offscreen")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+def timed_run(command, env):
+    start = time.perf_counter(); completed = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode not in (0, 1): raise RuntimeError(f"{' '.join(command)} : code {completed.returncode}\n{completed.stderr[-2000:]}")
+    return elapsed
+
+def make_typed_pdfs(folder, count):
+    # Documents déjà textuels : ignorés par le moteur, mais vus par le scan et mémorisés dans le manifeste
+    os.makedirs(folder)
+    for i in range(count):
+        with fitz.open() as document:
+            document.new_page().insert_text((72, 72), f"Document {i} déjà numérique, aucune page à reconnaître. " * 4)
+            document.save(os.path.join(folder, f"doc_{i:04d}.pdf"))
+
+def summary(values):
+    ordered = sorted(values)
+    return {"median_ms": round(statistics.median(ordered) * 1000, 1), "p95_ms": round(ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))] * 1000, 1),
+            "min_ms": round(ordered[0] * 1000, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai du temps de démarrage (import, premier lancement, redémarrage du service)")
+    parser.add_argument("--runs", type=int, default=10, help="Nombre de processus lancés par scénario")
+    parser.add_argument("--files", type=int, default=200, help="PDF présents dans le dossier surveillé (scan au démarrage)")
+    parser.add_argument("--gui", action="store_true", help="Mesure aussi l'import de l'interface (PyQt6)")
+    parser.add_argument("--max-import-ms", type=float, default=0.0, help="Code de sortie 1 si l'import médian du moteur dépasse cette durée")
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix="socrate_startup_"); folder = os.path.join(workdir, "entrée"); results = {}
+    python = sys.executable; batch = [python, "socrate.py", "batch", folder, "--lang", "English", "--workers", "1"]
+    scenarios = [("python", [python, "-c", "pass"], False), ("import_engine", [python, "-c", "import socrate_engine"], False),
+                 ("cli_help", [python, "socrate.py", "--help"], False), ("first_launch", batch, True), ("restart", batch, False)]
+    if args.gui: scenarios.append(("import_gui", [python, "-c", "import socrate_app"], False))
+    try:
+        make_typed_pdfs(folder, args.files)
+        for name, command, fresh in scenarios:
+            timings = []; home = os.path.join(workdir, "home")
+            for run in range(args.runs):
+                # Premier lancement : dossier de données vide à chaque fois ; redémarrage : celui laissé par les lancements précédents
+                if fresh: shutil.rmtree(home, ignore_errors=True)
+                timings.append(timed_run(command, isolated_env(home)))
+            results[name] = summary(timings)
+            print(f"{name:<14} médiane {results[name]['median_ms']:>8.1f} ms   p95 {results[name]['p95_ms']:>8.1f} ms   min {results[name]['min_ms']:>8.1f} ms", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    engine_only = results["import_engine"]["median_ms"] - results["python"]["median_ms"]
+    print(f"Import du moteur seul (hors démarrage de Python) : {engine_only:.1f} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump({"runs": args.runs, "files": args.files, "results": results}, f, indent=4)
+    return 1 if args.max_import_ms and engine_only > args.max_import_ms else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# benchmarks/bench_throughput.py
+# Banc d'essai de bout en bout : PDF synthétiques -> OCRWatcher (mode lot) -> débit, latences, mémoire, taille, rappel OCR.
+#   python benchmarks/bench_throughput.py --pages 1 10 50 --dpi 150 200 300 --mixed
+import os
+import re
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import itertools
+import tempfile
+import statistics
+import multiprocessing
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fitz  # PyMuPDF
+import socrate_engine
+from socrate_engine import LANG_OPTIONS, SAVE_PROFILE_OPTIONS, OCRWatcher, engine_profiles, load_settings
+from benchmarks.synthetic import make_pdf
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb():
+    # Pic de mémoire du processus principal et du plus gros processus OCR (Linux : Ko, macOS : octets)
+    if resource is None: return None, None
+    unit = 1 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2 ** 20, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2 ** 20)
+
+def normalize_words(text):
+    return Counter(re.findall(r"\w+", text.lower()))
+
+def recall(ground_truth, pdf_path):
+    # Part des mots de référence retrouvés dans la couche texte du PDF produit (comptage par multiensemble)
+    expected = found = 0
+    with fitz.open(pdf_path) as doc:
+        for page, truth in zip(doc, ground_truth):
+            truth_words = normalize_words(truth); page_words = normalize_words(page.get_text())
+            expected += sum(truth_words.values()); found += sum((truth_words & page_words).values())
+    return found / expected if expected else 1.0
+
+def percentile(values, fraction):
+    if not values: return 0.0
+    ordered = sorted(values); return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_scenario(workdir, page_count, dpi, mixed, profile, args):
+    source = os.path.join(workdir, f"in_{page_count}p_{dpi}dpi{'_mixte' if mixed else ''}_{profile}")
+    os.makedirs(source); pdf_path = os.path.join(source, "scan.pdf")
+    ground_truth = make_pdf(pdf_path, page_count, dpi=dpi, mixed=mixed, seed=page_count * 1000 + dpi)
+    input_size = os.path.getsize(pdf_path)
+    # Journal isolé et cache désactivé : chaque scénario repart de zéro. Mesures, index et empreinte des modèles restent aussi
+    # dans le dossier de travail : le banc ne touche pas aux fichiers d'un service en production sur la même machine.
+    socrate_engine.DB_FILE = os.path.join(workdir, "bench.db"); socrate_engine.INDEX_FILE = os.path.join(workdir, "search.db")
+    socrate_engine.METRICS_FILE = os.path.join(workdir, "metrics.json"); socrate_engine.TESSDATA_STAMP_FILE = os.path.join(workdir, "tessdata_stamp.json")
+    settings = {**load_settings({}), **args.settings, "cache_max_mb": 0}
+    if args.workers is not None: settings["ocr_workers"] = args.workers
+    rule = {"path": source, "lang": args.lang, "source_action": "Conserver l'original", "save_profile": args.save_profile, "preprocess": args.preprocess, "engine_profile": profile}
+    watcher = OCRWatcher({source: rule}, queue.Queue(), settings, watch=False)
+    start = time.perf_counter(); watcher.start(); watcher.join(); elapsed = time.perf_counter() - start
+    output_folder = os.path.join(source, "Traités_OCR"); outputs = os.listdir(output_folder) if os.path.isdir(output_folder) else []
+    # Document entièrement tapé : ignoré par le moteur, le fichier d'origine sert de résultat
+    output_path = os.path.join(output_folder, outputs[0]) if outputs else pdf_path; latencies = list(watcher.page_latencies)
+    return {"engine_profile": profile, "pages": page_count, "dpi": dpi, "mixed": mixed, "ocr_pages": watcher.stats["pages"], "seconds": round(elapsed, 3),
+            "pages_per_sec": round(page_count / elapsed, 3), "p50_page_s": round(percentile(latencies, 0.5), 3), "p95_page_s": round(percentile(latencies, 0.95), 3),
+            "size_growth_pct": round((os.path.getsize(output_path) / input_size - 1) * 100, 1), "recall": round(recall(ground_truth, output_path), 4),
+            "stage_seconds": {stage: entry["seconds"] for stage, entry in watcher.metrics.snapshot()["stages"].items()}}
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai de débit OCR sur PDF synthétiques")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50], help="Tailles de document (1 à 500 pages)")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 200, 300], help="Résolutions des scans générés")
+    parser.add_argument("--mixed", action="store_true", help="Ajoute les variantes mixtes (pages tapées + scannées)")
+    parser.add_argument("--lang", default="Français", choices=LANG_OPTIONS)
+    parser.add_argument("--engine-profile", nargs="+", default=["Standard"], help=f"Profils moteur à comparer ({', '.join(engine_profiles())})")
+    parser.add_argument("--workers", type=int, help="Nombre de processus OCR (défaut : réglage de l'application)")
+    parser.add_argument("--save-profile", default=SAVE_PROFILE_OPTIONS[0], choices=SAVE_PROFILE_OPTIONS, help="Profil d'enregistrement de la règle")
+    parser.add_argument("--preprocess", action="store_true", help="Active le prétraitement NumPy des pages (option de règle)")
+    parser.add_argument("--set", dest="settings", action="append", default=[], metavar="CLÉ=VALEUR", help="Réglage moteur supplémentaire (ex. raster_mode=300dpi)")
+    parser.add_argument("--min-recall", type=float, default=0.0, help="Code de sortie 1 si un scénario passe sous ce rappel")
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+    args = parser.parse_args()
+    args.settings = dict(item.split("=", 1) for item in args.settings)
+    unknown = set(args.engine_profile) - set(engine_profiles(load_settings({})))
+    if unknown: parser.error(f"profil moteur inconnu : {', '.join(sorted(unknown))}")
+    workdir = tempfile.mkdtemp(prefix="socrate_bench_"); results = []
+    try:
+        for profile, mixed, dpi, page_count in itertools.product(args.engine_profile, [False, True] if args.mixed else [False], args.dpi, args.pages):
+            result = run_scenario(workdir, page_count, dpi, mixed, profile, args); results.append(result)
+            print(f"{profile:<10} {page_count:>4} p  {dpi:>3} dpi  {'mixte ' if mixed else 'scan  '}  {result['pages_per_sec']:>7.2f} pages/s  "
+                  f"p50 {result['p50_page_s']:.3f} s  p95 {result['p95_page_s']:.3f} s  taille {result['size_growth_pct']:+.1f} %  rappel {result['recall']:.1%}", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    main_rss, worker_rss = peak_rss_mb()
+    if main_rss is not None: print(f"Pic mémoire : processus principal {main_rss:.0f} Mo, plus gros processus OCR {worker_rss:.0f} Mo")
+    for profile in args.engine_profile:
+        profile_results = [r for r in results if r["engine_profile"] == profile]
+        if profile_results: print(f"{profile} : débit médian {statistics.median(r['pages_per_sec'] for r in profile_results):.2f} pages/s, rappel médian {statistics.median(r['recall'] for r in profile_results):.1%}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump({"settings": args.settings, "save_profile": args.save_profile, "preprocess": args.preprocess, "workers": args.workers, "peak_rss_mb": {"main": main_rss, "ocr_worker": worker_rss}, "results": results}, f, indent=4)
+    return 1 if any(r["recall"] < args.min_recall for r in results) else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# benchmarks/synthetic.py
+# Génération hors ligne de PDF "scannés" au texte connu, pour mesurer débit et qualité de l'OCR
+import io
+import random
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFont
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 en points
+FONT_SIZE_PT = 11
+WORDS_PER_LINE = 9
+VOCABULARY = (
+    "facture client montant total date paiement contrat adresse livraison commande référence article quantité prix "
+    "remise échéance banque virement document signature service société dossier numéro rapport annexe période "
+    "invoice customer amount payment contract address delivery order reference quantity price discount bank "
+    "transfer signature company report period account balance tax net gross summary"
+).split()
+FONT_CANDIDATES = ["DejaVuSans.ttf", "Arial.ttf", "arial.ttf", "Helvetica.ttc", "LiberationSans-Regular.ttf"]
+
+def load_font(size_px):
+    for name in FONT_CANDIDATES:
+        try: return ImageFont.truetype(name, size_px)
+        except OSError: continue
+    return ImageFont.load_default(size_px)
+
+def page_lines(rng, line_count):
+    return [" ".join(rng.choice(VOCABULARY) for _ in range(WORDS_PER_LINE)) for _ in range(line_count)]
+
+def render_scan(lines, dpi, rng):
+    # Page blanche en niveaux de gris, texte noir, léger bruit de scanner, encodée en JPEG comme le ferait un copieur
+    scale = dpi / 72; font = load_font(max(8, int(FONT_SIZE_PT * scale)))
+    image = Image.new("L", (int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)), 250); draw = ImageDraw.Draw(image)
+    margin = int(56 * scale); line_height = int(FONT_SIZE_PT * 1.8 * scale)
+    for i, line in enumerate(lines): draw.text((margin, margin + i * line_height), line, fill=20, font=font)
+    for _ in range(int(image.width * image.height / 4000)): draw.point((rng.randrange(image.width), rng.randrange(image.height)), fill=rng.randrange(120, 200))
+    buffer = io.BytesIO(); image.save(buffer, "JPEG", quality=85, dpi=(dpi, dpi))
+    return buffer.getvalue()
+
+def make_pdf(path, page_count, dpi=300, mixed=False, seed=0, line_count=30):
+    # mixed=True : une page sur trois est tapée (vraie couche texte), les autres sont des images.
+    # Renvoie le texte de référence de chaque page.
+    rng = random.Random(seed); ground_truth = []
+    doc = fitz.open()
+    for number in range(page_count):
+        lines = page_lines(rng, line_count); page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        if mixed and number % 3 == 0:
+            page.insert_text((56, 56 + FONT_SIZE_PT), "\n".join(lines), fontsize=FONT_SIZE_PT, lineheight=1.8)
+        else:
+            page.insert_image(page.rect, stream=render_scan(lines, dpi, rng))
+        ground_truth.append("\n".join(lines))
+    doc.save(path, garbage=3, deflate=True); doc.close()
+    return ground_truth
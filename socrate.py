@@ -0,0 +1,125 @@
+# socrate.py
+# Point d'entrée sans interface graphique : python -m socrate batch <dossier> | watch | index <dossier> | search <mots>
+import os
+import sys
+import time
+import queue
+import signal
+import logging
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+
+# N'importe pas PyQt6 : le moteur seul suffit, et ses dépendances lourdes sont chargées à la demande
+from socrate_engine import APP_NAME, INDEX_FILE, LANG_OPTIONS, OCRWatcher, engine_profiles, ensure_app_dirs, iter_pdf_files, load_config, load_settings
+from socrate_index import SearchIndex, fts5_available, index_pdf
+
+def print_log_queue(log_queue, stop_event):
+    while not stop_event.is_set() or not log_queue.empty():
+        try: record = log_queue.get(timeout=0.2)
+        except queue.Empty: continue
+        if isinstance(record, str): print(f"[{time.strftime('%H:%M:%S')}] {record}", flush=True)
+
+def run_watcher(watcher, log_queue):
+    # Arrêt propre sur Ctrl+C ou SIGTERM (service, conteneur)
+    printer_stop = threading.Event(); printer = threading.Thread(target=print_log_queue, args=(log_queue, printer_stop), daemon=True); printer.start()
+    for signum in (signal.SIGINT, signal.SIGTERM): signal.signal(signum, lambda *_: watcher.stop())
+    start = time.perf_counter(); watcher.start()
+    while watcher.is_alive(): watcher.join(0.5)
+    printer_stop.set(); printer.join()
+    return time.perf_counter() - start
+
+def settings_from_args(args, config):
+    settings = load_settings(config)
+    if args.workers is not None: settings["ocr_workers"] = args.workers
+    if args.multi_node or args.node_id: settings["multi_node"] = True
+    if args.node_id: settings["node_id"] = args.node_id
+    return settings
+
+def cmd_batch(args):
+    path = os.path.normpath(os.path.abspath(args.directory))
+    if not os.path.isdir(path): print(f"Dossier introuvable : {path}", file=sys.stderr); return 2
+    config = load_config()
+    # La règle enregistrée pour ce dossier est réutilisée si elle existe, sinon une règle par défaut est construite
+    rule = next((c for c in config.get("monitored_configs", []) if os.path.normpath(c["path"]) == path), None)
+    rule = dict(rule) if rule else {"path": path, "lang": "Français"}
+    if args.lang: rule["lang"] = args.lang
+    if args.recursive: rule["recursive"] = True
+    if args.index: rule["search_index"] = True
+    if args.engine_profile:
+        if args.engine_profile not in engine_profiles(load_settings(config)): print(f"Profil moteur inconnu : {args.engine_profile}", file=sys.stderr); return 2
+        rule["engine_profile"] = args.engine_profile
+    rule["path"] = path
+    log_queue = queue.Queue(); watcher = OCRWatcher({path: rule}, log_queue, settings_from_args(args, config), watch=False)
+    elapsed = run_watcher(watcher, log_queue); stats = watcher.stats
+    print(f"{stats['files']} fichier(s), {stats['pages']} page(s) OCR en {elapsed:.1f} s "
+          f"({stats['pages'] / elapsed if elapsed else 0:.2f} pages/s), {stats['skipped']} ignoré(s), {stats['failed']} en échec.")
+    stages = watcher.metrics.snapshot()["stages"]
+    print("Temps par étape : " + ", ".join(f"{stage} {entry['seconds']:.1f} s" for stage, entry in stages.items() if entry["count"]))
+    return 1 if stats["failed"] else 0
+
+def cmd_watch(args):
+    config = load_config(); configs = config.get("monitored_configs", [])
+    if not configs: print("Aucune règle de surveillance dans la configuration.", file=sys.stderr); return 2
+    log_queue = queue.Queue(); watcher = OCRWatcher({c['path']: c for c in configs}, log_queue, settings_from_args(args, config))
+    run_watcher(watcher, log_queue)
+    return 0
+
+def cmd_index(args):
+    # Réindexation de PDF déjà traités (archives, dossiers Traités_OCR compris) à partir de leur couche texte : aucun OCR
+    path = os.path.normpath(os.path.abspath(args.directory))
+    if not os.path.isdir(path): print(f"Dossier introuvable : {path}", file=sys.stderr); return 2
+    if not fts5_available(): print("SQLite sans FTS5 : index de recherche indisponible.", file=sys.stderr); return 2
+    ensure_app_dirs(); index = SearchIndex(INDEX_FILE); indexed = pages = unchanged = failed = 0; start = time.perf_counter()
+    try:
+        for entry in iter_pdf_files(path, args.recursive, skip_outputs=False):
+            if not args.force and index.is_current(entry.path): unchanged += 1; continue
+            try: pages += index_pdf(index, entry.path); indexed += 1
+            except Exception as e: print(f"{entry.path} : {e}", file=sys.stderr); failed += 1
+        removed = index.prune()
+    finally:
+        index.close()
+    print(f"{indexed} fichier(s) indexé(s) ({pages} page(s)) en {time.perf_counter() - start:.1f} s, {unchanged} inchangé(s), "
+          f"{removed} disparu(s) retiré(s) de l'index, {failed} en échec.")
+    return 1 if failed else 0
+
+def cmd_search(args):
+    if not os.path.exists(INDEX_FILE): print("Aucun index de recherche : activez l'option sur une règle ou lancez 'socrate index'.", file=sys.stderr); return 2
+    index = SearchIndex(INDEX_FILE); start = time.perf_counter()
+    try: hits = index.search(" ".join(args.query), args.limit, args.raw)
+    except sqlite3.OperationalError as e: print(f"Requête invalide : {e}", file=sys.stderr); return 2
+    finally: index.close()
+    for path, page, snippet in hits: print(f"{path} (p. {page}) : {' '.join(snippet.split())}")
+    print(f"{len(hits)} résultat(s) en {(time.perf_counter() - start) * 1000:.0f} ms.")
+    return 0 if hits else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="socrate", description=f"{APP_NAME} sans interface graphique")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--workers", type=int, help="Nombre de processus OCR (0 = un par cœur)")
+    common.add_argument("--multi-node", action="store_true", help="Partage les dossiers avec d'autres instances : chaque fichier est pris sous bail par un seul nœud")
+    common.add_argument("--node-id", help="Nom de ce nœud dans les baux (par défaut : machine-pid) ; implique --multi-node")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    batch = subparsers.add_parser("batch", parents=[common], help="Traite les PDF d'un dossier puis s'arrête")
+    batch.add_argument("directory")
+    batch.add_argument("--lang", choices=LANG_OPTIONS, help="Langue OCR (par défaut celle de la règle, sinon Français)")
+    batch.add_argument("--engine-profile", help=f"Profil moteur ({', '.join(engine_profiles())} ou profil des réglages ; par défaut celui de la règle)")
+    batch.add_argument("--recursive", action="store_true", help="Traite aussi les sous-dossiers (hors 'Traités_OCR')")
+    batch.add_argument("--index", action="store_true", help="Ajoute les documents traités à l'index de recherche")
+    subparsers.add_parser("watch", parents=[common], help="Surveille les dossiers configurés (mode service)")
+    index = subparsers.add_parser("index", help="Ajoute à l'index de recherche les PDF d'un dossier, à partir de leur couche texte (sans OCR)")
+    index.add_argument("directory")
+    index.add_argument("--recursive", action="store_true", help="Parcourt aussi les sous-dossiers, 'Traités_OCR' compris")
+    index.add_argument("--force", action="store_true", help="Réindexe aussi les fichiers inchangés")
+    search = subparsers.add_parser("search", help="Cherche des pages dans l'index plein texte")
+    search.add_argument("query", nargs="+", help="Mots à trouver sur la même page ('mot*' pour un préfixe)")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--raw", action="store_true", help="Requête en syntaxe FTS5 (OR, NOT, NEAR, guillemets)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    return {"batch": cmd_batch, "watch": cmd_watch, "index": cmd_index, "search": cmd_search}[args.command](args)
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
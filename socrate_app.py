@@ -1,27 +1,31 @@
 # socrate_app.py
 import sys
 import os
+import re
+import time
 import queue
 import logging
+import multiprocessing
 import logging.handlers
 from datetime import datetime
+from collections import deque
 
 # --- Importation des composants PyQt6 ---
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-    QGroupBox, QLabel, QListWidget, QListWidgetItem, QPlainTextEdit,
+    QGroupBox, QLabel, QListWidget, QListWidgetItem, QListView,
     QFileDialog, QMessageBox, QDialog, QFormLayout, QLineEdit, QComboBox,
     QSpinBox, QCheckBox, QDialogButtonBox, QStyle, QGridLayout
 )
-from PyQt6.QtCore import Qt, QTimer, QSize
-from PyQt6.QtGui import QIcon, QTextCursor, QFont, QPixmap
+from PyQt6.QtCore import Qt, QTimer, QSize, QAbstractListModel, QModelIndex, QSortFilterProxyModel
+from PyQt6.QtGui import QIcon, QFont, QPixmap, QColor
 
 # --- Importation du moteur de l'application ---
 from socrate_engine import (
     APP_NAME, LOG_DIR, IS_WINDOWS,
-    OCRWatcher, load_config, save_config,
-    LANG_MAP, SOURCE_ACTION_OPTIONS, OUTPUT_DEST_OPTIONS,
-    FILE_RENAME_TOKENS, FOLDER_RENAME_TOKENS, COUNTER_RESET_OPTIONS,
+    OCRWatcher, ensure_app_dirs, load_config, save_config, load_settings,
+    LANG_OPTIONS, SOURCE_ACTION_OPTIONS, OUTPUT_DEST_OPTIONS, engine_profiles, models_installed,
+    FILE_RENAME_TOKENS, FOLDER_RENAME_TOKENS, COUNTER_RESET_OPTIONS, SAVE_PROFILE_OPTIONS, PRIORITY_OPTIONS,
     open_log_folder, add_to_startup, remove_from_startup, is_in_startup
 )
 
@@ -34,13 +38,72 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+# --- Journal d'événements : tampon circulaire affiché par lots ---
+LOG_MAX_LINES = 5000  # Lignes conservées à l'écran ; les plus anciennes restent dans app.log
+LOG_TICK_BUDGET = 0.02  # Secondes accordées à chaque tick pour vider la file des messages
+LOG_LEVEL_FILTERS = {"Tous les messages": "", "Avertissements et erreurs": "^(WARNING|ERROR|CRITICAL)$", "Erreurs seulement": "^(ERROR|CRITICAL)$"}
+LOG_COLORS = {"ERROR": "#FF7575", "CRITICAL": "#FF7575", "WARNING": "#FFD666", "SUCCESS": "#78FFA4", "INFO": "#A9B7C6"}
+LEVEL_PATTERN = re.compile(r"^\[(\w+)\] ")
+PROGRESS_PATTERN = re.compile(r"-> OCR Page \d+/\d+ de '(.+?)'")  # Une ligne par fichier, mise à jour à chaque page
+FINISHED_PATTERN = re.compile(r"^'(.+?)' (terminé|contient déjà)")
+
+class LogModel(QAbstractListModel):
+    # Lignes du journal dans une deque de taille fixe : ajout et suppression par lots, une seule notification Qt par tick.
+    # Chaque ligne porte un numéro de séquence : son index = séquence - séquence de la plus ancienne ligne encore affichée.
+    LevelRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent); self.lines = deque(); self.first_seq = 0; self.next_seq = 0
+        self.progress_lines = {}  # nom de fichier -> ligne de progression en cours de mise à jour
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.lines)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        line = self.lines[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole: return f"[{line[1]}] {line[3]}"
+        if role == Qt.ItemDataRole.ForegroundRole: return QColor(LOG_COLORS.get(line[2], LOG_COLORS["INFO"]))
+        if role == self.LevelRole: return "INFO" if line[2] == "SUCCESS" else line[2]
+        return None
+
+    def append_batch(self, records):
+        # records : chaînes "[NIVEAU] message". Les lignes de progression d'un même fichier sont fusionnées.
+        now = datetime.now().strftime('%H:%M:%S'); shown_before = self.next_seq; new_lines = []; updated = set()
+        for record in records:
+            match = LEVEL_PATTERN.match(record); level = match.group(1).upper() if match else "INFO"; message = (record[match.end():] if match else record).strip()
+            progress = PROGRESS_PATTERN.search(message); finished = FINISHED_PATTERN.match(message)
+            if level == "INFO" and (finished or "démarrée" in message or "sauvegardée" in message): level = "SUCCESS"
+            if progress and progress.group(1) in self.progress_lines:
+                line = self.progress_lines[progress.group(1)]; line[1] = now; line[3] = message
+                if line[0] < shown_before: updated.add(line[0])
+                continue
+            line = [self.next_seq, now, level, message]; self.next_seq += 1; new_lines.append(line)
+            if progress: self.progress_lines[progress.group(1)] = line
+            if finished: self.progress_lines.pop(finished.group(1), None)
+        # Les lignes les plus anciennes sortent du tampon avant l'insertion des nouvelles
+        new_lines = new_lines[-LOG_MAX_LINES:]; overflow = min(len(self.lines), len(self.lines) + len(new_lines) - LOG_MAX_LINES)
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow): self.lines.popleft()
+            self.endRemoveRows()
+        if new_lines:
+            self.beginInsertRows(QModelIndex(), len(self.lines), len(self.lines) + len(new_lines) - 1); self.lines.extend(new_lines); self.endInsertRows()
+        self.first_seq = self.lines[0][0] if self.lines else self.next_seq
+        for seq in updated:
+            if seq >= self.first_seq: index = self.index(seq - self.first_seq); self.dataChanged.emit(index, index)
+        self.progress_lines = {name: line for name, line in self.progress_lines.items() if line[0] >= self.first_seq}
+
+    def clear(self):
+        self.beginResetModel(); self.lines.clear(); self.progress_lines.clear(); self.first_seq = self.next_seq; self.endResetModel()
+
 # --- ✨ FEUILLE DE STYLE FINALE ✨ ---
 STYLESHEET = """
 QMainWindow, #MainAppWindow, QDialog { background-color: qradialgradient(cx: 0.3, cy: -0.4, fx: 0.3, fy: -0.4, radius: 1.35, stop: 0 #2d3a5a, stop: 1 #1d2538); }
 QWidget { color: #E0E0E0; font-size: 12pt; }
 QGroupBox { font-size: 14pt; font-weight: bold; background-color: rgba(45, 58, 90, 0.5); border: 1px solid rgba(255, 255, 255, 0.1); border-radius: 12px; margin-top: 10px; padding-top: 15px; }
 QGroupBox::title { subcontrol-origin: margin; subcontrol-position: top left; padding: 0 10px; color: #FFFFFF; }
-QPlainTextEdit, QListWidget { background-color: rgba(29, 37, 56, 0.8); border: none; border-radius: 8px; padding: 8px; }
+QListView, QListWidget { background-color: rgba(29, 37, 56, 0.8); border: none; border-radius: 8px; padding: 8px; }
 QListWidget::item { padding: 10px; border-radius: 5px; }
 QListWidget::item:selected, QListWidget::item:hover { background-color: rgba(0, 120, 215, 0.5); border: 1px solid #0078D7; }
 QPushButton { background-color: #0078D7; color: white; border: none; padding: 8px 16px; border-radius: 8px; font-weight: bold; }
@@ -73,6 +136,8 @@ class FolderSettingsDialog(QDialog):
         path_group = QGroupBox("📁 Dossier à surveiller"); path_layout = QHBoxLayout()
         self.path_entry = QLineEdit(self.config.get("path", "")); self.path_button = QPushButton("..."); self.path_button.setFixedWidth(40)
         self.path_button.clicked.connect(lambda: self.browse_for_entry(self.path_entry)); path_layout.addWidget(self.path_entry); path_layout.addWidget(self.path_button)
+        self.recursive_check = QCheckBox("Inclure les sous-dossiers"); self.recursive_check.setChecked(bool(self.config.get("recursive", False)))
+        self.recursive_check.setToolTip("Les sous-dossiers 'Traités_OCR', d'archivage et de sortie spécifique sont toujours ignorés."); path_layout.addWidget(self.recursive_check)
         path_group.setLayout(path_layout); main_layout.addWidget(path_group); grid_layout = QGridLayout()
         source_group = QGroupBox("1. Fichier Original (Après OCR)"); self.source_layout = QFormLayout(source_group); self.source_layout.setSpacing(10)
         self.source_action_menu = QComboBox(); self.source_action_menu.addItems(SOURCE_ACTION_OPTIONS); self.source_action_menu.setCurrentText(self.config.get("source_action", SOURCE_ACTION_OPTIONS[0]))
@@ -81,10 +146,29 @@ class FolderSettingsDialog(QDialog):
         self.archive_path_row_index = self.source_layout.rowCount() - 1; self.create_token_buttons(self.source_layout, self.archive_path_entry, FOLDER_RENAME_TOKENS); self.archive_tokens_row_index = self.source_layout.rowCount() - 1
         grid_layout.addWidget(source_group, 0, 0)
         output_group = QGroupBox("2. Fichier Traité (Avec OCR)"); self.output_layout = QFormLayout(output_group); self.output_layout.setSpacing(10)
-        self.lang_menu = QComboBox(); self.lang_menu.addItems(LANG_MAP.keys()); self.lang_menu.setCurrentText(self.config.get("lang", "Français")); self.lang_menu.setMinimumWidth(250)
-        self.output_layout.addRow("Langue OCR :", self.lang_menu); self.output_dest_menu = QComboBox(); self.output_dest_menu.addItems(OUTPUT_DEST_OPTIONS)
+        self.lang_menu = QComboBox(); self.lang_menu.addItems(LANG_OPTIONS)
+        if self.config.get("lang", "Français") not in LANG_OPTIONS: self.lang_menu.addItem(self.config["lang"])  # Combinaison saisie dans config.json
+        self.lang_menu.setCurrentText(self.config.get("lang", "Français")); self.lang_menu.setMinimumWidth(250)
+        self.output_layout.addRow("Langue OCR :", self.lang_menu)
+        # Profils dont les modèles ne sont pas installés masqués : ils tourneraient avec les modèles par défaut, comme « Standard »
+        profiles = {name: p for name, p in engine_profiles(getattr(parent, "settings", None)).items() if models_installed(p["models"])}; self.engine_profile_menu = QComboBox(); self.engine_profile_menu.addItems(profiles)
+        self.engine_profile_menu.setCurrentText(self.config.get("engine_profile", "Standard")); self.engine_profile_menu.setMinimumWidth(250)
+        self.engine_profile_menu.setToolTip("\n".join(f"{name} : modèles {p['models']}, OEM {p['oem']}, PSM {p['psm']}, {p['threads']} thread(s)" for name, p in profiles.items()))
+        self.output_layout.addRow("Profil moteur :", self.engine_profile_menu); self.output_dest_menu = QComboBox(); self.output_dest_menu.addItems(OUTPUT_DEST_OPTIONS)
         self.output_dest_menu.setCurrentText(self.config.get("output_dest_type", OUTPUT_DEST_OPTIONS[0])); self.output_dest_menu.currentTextChanged.connect(self.toggle_widgets)
         self.output_dest_menu.setMinimumWidth(250); self.output_layout.addRow("Destination :", self.output_dest_menu)
+        self.save_profile_menu = QComboBox(); self.save_profile_menu.addItems(SAVE_PROFILE_OPTIONS); self.save_profile_menu.setCurrentText(self.config.get("save_profile", SAVE_PROFILE_OPTIONS[0])); self.save_profile_menu.setMinimumWidth(250)
+        self.save_profile_menu.setToolTip("Compact : fichier le plus petit, enregistrement lent sur les gros scans.\nRapide : sans nettoyage ni dédoublonnage.\nIncrémental : ajoute le texte à la fin du fichier (en place si l'original est écrasé).")
+        self.output_layout.addRow("Enregistrement :", self.save_profile_menu)
+        self.priority_menu = QComboBox(); self.priority_menu.addItems(PRIORITY_OPTIONS); self.priority_menu.setCurrentText(self.config.get("priority", "Normale")); self.priority_menu.setMinimumWidth(250)
+        self.priority_menu.setToolTip("Part des pages traitées quand plusieurs dossiers ont des fichiers en attente (Haute : 4, Normale : 2, Basse : 1).")
+        self.output_layout.addRow("Priorité :", self.priority_menu)
+        self.preprocess_check = QCheckBox("Nettoyer les scans avant l'OCR"); self.preprocess_check.setChecked(bool(self.config.get("preprocess", False)))
+        self.preprocess_check.setToolTip("Redressement, recadrage des bords, réduction et binarisation des pages (nécessite NumPy).")
+        self.output_layout.addRow("Prétraitement :", self.preprocess_check)
+        self.search_index_check = QCheckBox("Indexer le texte pour la recherche"); self.search_index_check.setChecked(bool(self.config.get("search_index", False)))
+        self.search_index_check.setToolTip("Texte et position des mots de chaque page enregistrés dans un index plein texte (commande 'socrate search').")
+        self.output_layout.addRow("Recherche :", self.search_index_check)
         output_path_widget, self.output_path_entry = self._create_path_input(self.config.get("output_path_pattern", ""))
         self.output_layout.addRow("Dossier de destination :", output_path_widget); self.output_path_row_index = self.output_layout.rowCount() - 1
         self.create_token_buttons(self.output_layout, self.output_path_entry, FOLDER_RENAME_TOKENS); self.output_tokens_row_index = self.output_layout.rowCount() - 1
@@ -119,19 +203,20 @@ class FolderSettingsDialog(QDialog):
     def on_ok(self):
         path = self.path_entry.text().strip()
         if not path or not os.path.isdir(path): QMessageBox.critical(self, "Erreur", "Le chemin du dossier à surveiller est invalide."); return
-        self.result = {"path": os.path.normpath(path),"lang": self.lang_menu.currentText(),"source_action": self.source_action_menu.currentText(),"archive_path_pattern": self.archive_path_entry.text(),"output_dest_type": self.output_dest_menu.currentText(),"output_path_pattern": self.output_path_entry.text(),"rename_pattern": self.rename_pattern_entry.text(),"counter_reset": self.counter_reset_menu.currentText(),"counter_padding": self.counter_padding_spinbox.value()}
+        self.result = {"path": os.path.normpath(path),"lang": self.lang_menu.currentText(),"source_action": self.source_action_menu.currentText(),"archive_path_pattern": self.archive_path_entry.text(),"output_dest_type": self.output_dest_menu.currentText(),"output_path_pattern": self.output_path_entry.text(),"rename_pattern": self.rename_pattern_entry.text(),"counter_reset": self.counter_reset_menu.currentText(),"counter_padding": self.counter_padding_spinbox.value(),"save_profile": self.save_profile_menu.currentText(),"recursive": self.recursive_check.isChecked(),"priority": self.priority_menu.currentText(),"preprocess": self.preprocess_check.isChecked(),"search_index": self.search_index_check.isChecked(),"engine_profile": self.engine_profile_menu.currentText()}
         self.accept()
 
 class App(QMainWindow):
     def __init__(self):
         super().__init__(); self.setObjectName("MainAppWindow"); self.setWindowTitle(f"{APP_NAME}"); self.setMinimumSize(1100, 750)
         self.setWindowIcon(QIcon(resource_path("assets/icon.png"))); self.monitored_configs = []; self.worker_thread = None; self.log_queue = queue.Queue()
-        self.progress_lines = {}; self.setup_logging()
+        self.setup_logging()
         self.central_widget = QWidget(); self.setCentralWidget(self.central_widget)
         main_v_layout = QVBoxLayout(self.central_widget); self.setup_top_bar(main_v_layout); self.grid_layout = QGridLayout(); main_v_layout.addLayout(self.grid_layout)
         self.setup_control_panel(); self.setup_folders_panel(); self.setup_log_panel()
         self.grid_layout.setColumnStretch(0, 1); self.grid_layout.setColumnStretch(1, 2); self.grid_layout.setRowStretch(0, 0); self.grid_layout.setRowStretch(1, 1)
-        self.monitored_configs = load_config().get("monitored_configs", []); self.update_folder_listbox(); self.on_folder_select()
+        config = load_config(); self.monitored_configs = config.get("monitored_configs", []); self.settings = load_settings(config)
+        self.workers_spinbox.setValue(int(self.settings["ocr_workers"])); self.update_folder_listbox(); self.on_folder_select()
     def setup_top_bar(self, parent_layout):
         top_bar_layout = QHBoxLayout(); top_bar_layout.setContentsMargins(10, 5, 10, 15); title = QLabel(f"{APP_NAME}"); title.setObjectName("AppTitle")
         quit_button = QPushButton("Quitter"); quit_button.setObjectName("QuitButton"); quit_button.clicked.connect(self.close)
@@ -148,6 +233,9 @@ class App(QMainWindow):
         self.stop_button = QPushButton(" Arrêter"); self.stop_button.setObjectName("StopButton")
         self.stop_button.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaStop)); self.stop_button.setIconSize(QSize(22, 22))
         self.stop_button.setEnabled(False); self.stop_button.clicked.connect(self.stop_surveillance); button_layout.addWidget(self.stop_button); layout.addLayout(button_layout)
+        workers_layout = QHBoxLayout(); workers_layout.addStretch(); workers_layout.addWidget(QLabel("Processus OCR :"))
+        self.workers_spinbox = QSpinBox(); self.workers_spinbox.setRange(0, 256); self.workers_spinbox.setSpecialValueText(f"Auto ({os.cpu_count()})")
+        self.workers_spinbox.setToolTip("Nombre de processus utilisés pour l'OCR des pages (Auto = un par cœur)"); workers_layout.addWidget(self.workers_spinbox); workers_layout.addStretch(); layout.addLayout(workers_layout)
         if IS_WINDOWS:
             startup_layout = QHBoxLayout(); startup_layout.addStretch(); self.startup_check = QCheckBox("Lancer au démarrage"); self.startup_check.setChecked(is_in_startup()); self.startup_check.toggled.connect(self.update_startup_setting)
             startup_layout.addWidget(self.startup_check); startup_layout.addStretch(); layout.addLayout(startup_layout)
@@ -164,12 +252,17 @@ class App(QMainWindow):
         layout.addLayout(buttons_layout); self.grid_layout.addWidget(folders_group, 1, 0)
     def setup_log_panel(self):
         log_group = QGroupBox("Journal d'événements"); layout = QVBoxLayout(log_group)
-        self.log_textbox = QPlainTextEdit(); self.log_textbox.setReadOnly(True); self.log_textbox.setStyleSheet("font-family: monospace; font-size: 10pt;")
-        layout.addWidget(self.log_textbox, 1); buttons_layout = QHBoxLayout(); buttons_layout.addStretch()
+        # Vue virtuelle : seules les lignes visibles sont dessinées, quel que soit le nombre de lignes en mémoire
+        self.log_model = LogModel(self); self.log_filter = QSortFilterProxyModel(self); self.log_filter.setSourceModel(self.log_model); self.log_filter.setFilterRole(LogModel.LevelRole)
+        self.log_view = QListView(); self.log_view.setModel(self.log_filter); self.log_view.setUniformItemSizes(True); self.log_view.setWordWrap(False)
+        self.log_view.setSelectionMode(QListView.SelectionMode.ExtendedSelection); self.log_view.setStyleSheet("font-family: monospace; font-size: 10pt;")
+        layout.addWidget(self.log_view, 1); buttons_layout = QHBoxLayout()
+        self.log_level_menu = QComboBox(); self.log_level_menu.addItems(LOG_LEVEL_FILTERS.keys()); self.log_level_menu.setToolTip("Niveau des messages affichés")
+        self.log_level_menu.currentTextChanged.connect(lambda text: self.log_filter.setFilterRegularExpression(LOG_LEVEL_FILTERS[text])); buttons_layout.addWidget(self.log_level_menu); buttons_layout.addStretch()
         open_log_folder_btn = QPushButton("Logs"); open_log_folder_btn.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon))
         open_log_folder_btn.setToolTip("Ouvrir le dossier contenant les fichiers de log"); open_log_folder_btn.clicked.connect(open_log_folder)
         clear_log_btn = QPushButton("Nettoyer"); clear_log_btn.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_DialogDiscardButton))
-        clear_log_btn.setToolTip("Effacer le journal d'événements affiché"); clear_log_btn.clicked.connect(self.log_textbox.clear)
+        clear_log_btn.setToolTip("Effacer le journal d'événements affiché"); clear_log_btn.clicked.connect(self.log_model.clear)
         buttons_layout.addWidget(open_log_folder_btn); buttons_layout.addWidget(clear_log_btn); layout.addLayout(buttons_layout)
         self.grid_layout.addWidget(log_group, 0, 1, 2, 1)
     def setup_logging(self):
@@ -179,48 +272,31 @@ class App(QMainWindow):
         logger = logging.getLogger();
         if not logger.handlers:
             logger.setLevel(logging.INFO)
-            file_handler = logging.handlers.TimedRotatingFileHandler(os.path.join(LOG_DIR, "app.log"), when='midnight', interval=1, backupCount=7)
+            ensure_app_dirs(); file_handler = logging.handlers.TimedRotatingFileHandler(os.path.join(LOG_DIR, "app.log"), when='midnight', interval=1, backupCount=7)
             file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')); logger.addHandler(file_handler)
-            queue_handler = QueueHandler(self.log_queue); queue_handler.setFormatter(logging.Formatter('%(message)s')); logger.addHandler(queue_handler)
+            queue_handler = QueueHandler(self.log_queue); queue_handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s')); logger.addHandler(queue_handler)
         self.log_timer = QTimer(self); self.log_timer.timeout.connect(self.process_log_queue); self.log_timer.start(250)
     
-    # --- ✨ MÉTHODE DE LOG CORRIGÉE ET ROBUSTE ✨ ---
     def process_log_queue(self):
-        while not self.log_queue.empty():
-            record = self.log_queue.get()
-            
-            # Plafonnement simple à 500 lignes
-            if self.log_textbox.blockCount() > 500:
-                cursor = self.log_textbox.textCursor()
-                cursor.movePosition(QTextCursor.MoveOperation.Start)
-                cursor.select(QTextCursor.SelectionType.LineUnderCursor)
-                cursor.removeSelectedText()
-                cursor.deletePreviousChar()
-            
-            now = datetime.now().strftime('%H:%M:%S')
-            
-            # Logique d'affichage simple et directe, sans mise à jour de ligne
-            color = "#A9B7C6" # Gris par défaut
-            if isinstance(record, str):
-                if "[ERROR]" in record or "[CRITICAL]" in record:
-                    color = "#FF7575" # Rouge
-                elif "[WARNING]" in record:
-                    color = "#FFD666" # Jaune
-                elif "terminé" in record or "sauvé" in record or "démarrée" in record:
-                    color = "#78FFA4" # Vert
-                
-                line = f'<span style="color: #888;">[{now}]</span> <span style="color: {color};">{record}</span>'
-                self.log_textbox.appendHtml(line)
-        
-        self.log_textbox.moveCursor(QTextCursor.MoveOperation.End)
+        # Vidage borné dans le temps : le moteur n'attend jamais l'affichage, et un afflux de messages ne fige pas l'interface
+        deadline = time.perf_counter() + LOG_TICK_BUDGET; records = []
+        while time.perf_counter() < deadline:
+            try: record = self.log_queue.get_nowait()
+            except queue.Empty: break
+            if isinstance(record, str): records.append(record)
+        if not records: return
+        scrollbar = self.log_view.verticalScrollBar(); follow = scrollbar.value() >= scrollbar.maximum() - 2
+        self.log_model.append_batch(records)
+        if follow: self.log_view.scrollToBottom()
 
     def log(self, msg, level="info"): logging.info(msg) if level=="info" else logging.error(msg)
     def on_save_config(self):
-        save_config({"monitored_configs": self.monitored_configs}); self.log("Configuration sauvegardée.")
+        self.settings["ocr_workers"] = self.workers_spinbox.value()
+        save_config({"monitored_configs": self.monitored_configs, "settings": self.settings}); self.log("Configuration sauvegardée.")
     def update_folder_listbox(self):
         self.folder_listbox.clear()
         for i, config in enumerate(self.monitored_configs):
-            icon = self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon); item = QListWidgetItem(icon, f"  {config['path']}")
+            icon = self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon); item = QListWidgetItem(icon, f"  {config['path']}{'  (+ sous-dossiers)' if config.get('recursive') else ''}")
             item.setData(Qt.ItemDataRole.UserRole, i); self.folder_listbox.addItem(item)
     def on_folder_select(self):
         is_selected = bool(self.folder_listbox.selectedItems())
@@ -253,11 +329,12 @@ class App(QMainWindow):
     def start_surveillance(self):
         if not self.monitored_configs: QMessageBox.warning(self, "Aucune règle", "Veuillez ajouter au moins un dossier à surveiller."); return
         configs_map = {config['path']: config for config in self.monitored_configs}
-        self.worker_thread = OCRWatcher(configs_map, self.log_queue); self.worker_thread.start()
-        self.start_button.setEnabled(False); self.stop_button.setEnabled(True); self.log("Surveillance démarrée.")
+        self.settings["ocr_workers"] = self.workers_spinbox.value()
+        self.worker_thread = OCRWatcher(configs_map, self.log_queue, self.settings); self.worker_thread.start()
+        self.start_button.setEnabled(False); self.stop_button.setEnabled(True); self.workers_spinbox.setEnabled(False); self.log("Surveillance démarrée.")
     def stop_surveillance(self):
         if self.worker_thread: self.worker_thread.stop()
-        self.start_button.setEnabled(True); self.stop_button.setEnabled(False)
+        self.start_button.setEnabled(True); self.stop_button.setEnabled(False); self.workers_spinbox.setEnabled(True)
     def update_startup_setting(self):
         if not IS_WINDOWS: return
         try:
@@ -272,6 +349,8 @@ class App(QMainWindow):
         self.log_timer.stop(); event.accept()
 
 if __name__ == "__main__":
+    # Indispensable pour le pool de processus OCR dans l'application compilée (PyInstaller)
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyleSheet(STYLESHEET)
     window = App()
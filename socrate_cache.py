@@ -0,0 +1,66 @@
+# socrate_cache.py
+
+import os
+import json
+import zlib
+import time
+import hashlib
+
+# À incrémenter si le format des données mises en cache change
+CACHE_VERSION = 1
+
+class OCRCache:
+    # Cache disque adressé par contenu : clé = empreinte du raster + réglages du moteur, valeur = résultat de image_to_data.
+    # Un fichier par page (écriture atomique), ce qui permet aux processus OCR de le partager sans verrou.
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir; self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(raster, *settings):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{CACHE_VERSION}|{raster.width}x{raster.height}|{raster.stride}|{raster.dpi:.2f}|{'|'.join(map(str, settings))}".encode("utf-8"))
+        digest.update(raster.samples)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json.z")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f: data = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error): return None
+        # La date de modification sert d'horodatage LRU
+        try: os.utime(path)
+        except OSError: pass
+        return data
+
+    def put(self, key, data):
+        path = self._path(key); temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "wb") as f: f.write(zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8")))
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path): os.remove(temp_path)
+
+    def evict(self):
+        # Supprime les entrées les moins récemment utilisées jusqu'à repasser sous 90 % de la taille maximale
+        entries = []; total = 0
+        try:
+            for bucket in os.scandir(self.cache_dir):
+                if not bucket.is_dir(): continue
+                for entry in os.scandir(bucket.path):
+                    try: stat = entry.stat()
+                    except OSError: continue
+                    if entry.name.endswith(".tmp") and time.time() - stat.st_mtime < 3600: continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path)); total += stat.st_size
+        except FileNotFoundError: return 0, 0
+        if total <= self.max_bytes: return 0, 0
+        removed = freed = 0; target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total - freed <= target: break
+            try: os.remove(path)
+            except OSError: continue
+            removed += 1; freed += size
+        return removed, freed
@@ -6,23 +6,31 @@ import json
 import logging
 import threading
 import time
-import queue
+import re
 import shutil
+import base64
+import functools
 import subprocess
+import importlib.util
+import multiprocessing
 from datetime import datetime
+from collections import deque
 import socket
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 
 # --- Dépendances ---
 import appdirs
-from PIL import Image
-import io
 
 # --- Bibliothèques pour l'OCR et la surveillance ---
-import pytesseract
-import fitz  # PyMuPDF
-from pytesseract import Output
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+# fitz (PyMuPDF), pytesseract, watchdog et socrate_ocr sont importés à la première utilisation :
+# importer le moteur (interface, ligne de commande) reste rapide et léger.
+from socrate_cache import OCRCache
+from socrate_store import JOB_QUEUED, JobJournal, ScanManifest, StateStore
+from socrate_scheduler import ConcurrencyGovernor, FairShare, MemoryBudget, StabilityTracker
+from socrate_metrics import Metrics, MetricsExporter
+from socrate_lease import LEASE_DONE, LEASE_HELD, LeaseManager
+from socrate_index import SearchIndex, fts5_available, page_words
 
 # --- Constantes et Fonctions Utilitaires ---
 APP_NAME = "sOCRate"
@@ -30,78 +38,171 @@ APP_AUTHOR = "Amaury Poussier"
 IS_WINDOWS = sys.platform == "win32"
 if IS_WINDOWS:
     import winreg
+# Aucun dossier n'est créé à l'import : ensure_app_dirs() est appelé par ce qui écrit (configuration, journal, fichiers de log)
 APP_DATA_DIR = appdirs.user_data_dir(APP_NAME, APP_AUTHOR)
 LOG_DIR = appdirs.user_log_dir(APP_NAME, APP_AUTHOR)
-os.makedirs(APP_DATA_DIR, exist_ok=True)
-os.makedirs(LOG_DIR, exist_ok=True)
 CONFIG_FILE = os.path.join(APP_DATA_DIR, "config.json")
 STATE_FILE = os.path.join(APP_DATA_DIR, "state.json")
 LOG_FILE = os.path.join(LOG_DIR, "app.log") # Le fichier de log principal
+OCR_CACHE_DIR = os.path.join(APP_DATA_DIR, "ocr_cache")
+DB_FILE = os.path.join(APP_DATA_DIR, "socrate.db")  # Journal des tâches (SQLite)
+INDEX_FILE = os.path.join(APP_DATA_DIR, "search.db")  # Index de recherche plein texte des règles qui l'activent (SQLite FTS5)
+METRICS_FILE = os.path.join(APP_DATA_DIR, "metrics.json")  # Mesures du moteur, réécrites toutes les metrics_interval secondes
+TESSDATA_STAMP_FILE = os.path.join(APP_DATA_DIR, "tessdata_stamp.json")  # Modèles de langue déjà vérifiés (chemin -> taille, date)
+TESSDATA_STAMP_VERSION = 1  # À incrémenter si la vérification des modèles change : tous sont alors revérifiés une fois
+CACHE_EVICT_INTERVAL = 60  # Secondes entre deux passes d'éviction du cache OCR
 LANG_MAP = {"Français": "fra", "English": "eng", "Português": "por"}
+# Combinaisons proposées pour une règle ("+" entre les langues) : Tesseract charge chaque modèle et choisit mot par mot
+LANG_OPTIONS = list(LANG_MAP) + ["Français+English", "Français+Português", "English+Português"]
+# Profils moteur (par règle) : variante des modèles (tessdata standard, fast ou best), mode du moteur (OEM : 1 = LSTM seul,
+# 3 = selon les modèles), segmentation (PSM : 3 = automatique) et threads OpenMP par processus OCR.
+# La clé "engine_profiles" des réglages ajoute ou redéfinit des profils.
+ENGINE_PROFILES = {
+    "Standard": {"models": "standard", "oem": 3, "psm": 3, "threads": 1},
+    "Rapide": {"models": "fast", "oem": 1, "psm": 3, "threads": 1},
+    "Précis": {"models": "best", "oem": 1, "psm": 3, "threads": 1},
+}
 SOURCE_ACTION_OPTIONS = ["Conserver l'original", "Déplacer l'original", "Écraser l'original"]
+OUTPUT_SUBFOLDER = "Traités_OCR"  # Jamais parcouru par le scan ni suivi dans les règles récursives : il ne contient que des résultats
 OUTPUT_DEST_OPTIONS = ["Dans un sous-dossier 'Traités_OCR'", "Dans le même dossier que l'original", "Dans un dossier spécifique"]
 FILE_RENAME_TOKENS = ["[NOM_ORIGINAL]", "[DATE]", "[HEURE]", "[COMPTEUR]", "[POIDS_FICHIER]", "[NOMBRE_PAGES]"]
 FOLDER_RENAME_TOKENS = ["[NOM_UTILISATEUR]", "[NOM_ORDINATEUR]", "[DATE]"]
 COUNTER_RESET_OPTIONS = ["Jamais", "Chaque jour", "Chaque mois", "Chaque année"]
-
-def setup_tesseract_data():
-    try:
-        cache_dir = appdirs.user_data_dir(APP_NAME, APP_AUTHOR)
-        tessdata_cache_path = os.path.join(cache_dir, 'tessdata_v1')
-        if os.path.exists(tessdata_cache_path): return tessdata_cache_path
-        bundle_dir = getattr(sys, '_MEIPASS', os.path.abspath(os.path.join(os.path.dirname(sys.executable), '..', 'Resources')))
-        source_tessdata_path = os.path.join(bundle_dir, 'Tesseract-OCR', 'share', 'tessdata')
-        if not os.path.exists(source_tessdata_path):
-            logging.error(f"Source tessdata introuvable à {source_tessdata_path}")
-            return None
-        logging.info(f"Copie de tessdata vers le cache : {tessdata_cache_path}")
-        shutil.copytree(source_tessdata_path, tessdata_cache_path)
-        return tessdata_cache_path
-    except Exception as e:
-        logging.error(f"Erreur fatale lors de la configuration du cache de Tesseract : {e}")
-        return None
+# Profils d'enregistrement du PDF produit (par règle) : "Compact" réécrit et dédoublonne tout le document (lent sur les gros scans),
+# "Rapide" écrit sans nettoyage ni dédoublonnage, "Incrémental" ajoute seulement les couches texte à la fin du fichier existant.
+SAVE_PROFILE_OPTIONS = ["Compact", "Rapide", "Incrémental"]
+SAVE_PROFILES = {"Compact": {"garbage": 4, "deflate": True, "clean": True}, "Rapide": {"garbage": 0, "deflate": True}}
+# Priorité d'une règle : poids de sa part des pages traitées quand plusieurs règles ont des fichiers en attente
+PRIORITY_OPTIONS = ["Haute", "Normale", "Basse"]
+PRIORITY_WEIGHTS = {"Haute": 4, "Normale": 2, "Basse": 1}
+EXPRESS_MAX_PAGES = 10  # Un thread de plus, réservé aux documents d'au plus ce nombre de pages : une facture ne patiente pas derrière un gros import
+# Réglages globaux du moteur (clé "settings" de config.json). 0 processus OCR = un par cœur.
+DEFAULT_SETTINGS = {"ocr_workers": 0, "max_concurrent_files": 0, "min_concurrent_files": 1, "adaptive_concurrency": True, "memory_reserve_mb": 512, "ocr_backend": "auto", "raster_mode": "auto", "cache_max_mb": 500, "text_layer": "textwriter",
+                    "shortest_job_first": True, "engine_profiles": {}, "metrics_interval": 15, "metrics_port": 0,
+                    "memory_budget_mb": 0, "multi_node": False, "node_id": "", "lease_ttl": 120}  # Port 0 : pas de point d'accès Prometheus
+FALLBACK_MEMORY_BUDGET_MB = 1024  # Budget des pages quand memory_budget_mb vaut 0 (auto) et que la mémoire du système ne peut pas être mesurée
+PAGES_PER_TASK = 4  # Nombre maximal de pages envoyées d'un coup à un processus OCR
+TASKS_IN_FLIGHT_PER_WORKER = 2  # Lots envoyés d'avance par fichier et par processus : les processus ne chôment pas, la file reste courte
+OCR_BYTES_PER_PIXEL = 8  # Mémoire d'une page en cours d'OCR : raster 8 bits et copies internes de Tesseract (binarisation, lignes)
+# Nature d'une page, déterminée une seule fois à l'ouverture du document
+PAGE_TEXT, PAGE_IMAGE, PAGE_MIXED = "texte", "image", "mixte"
+MIN_TEXT_CHARS = 50  # En dessous, la couche texte existante est considérée comme vide
+MIXED_IMAGE_COVERAGE = 0.3  # Part de la page couverte par des images au-delà de laquelle une page texte est "mixte"
+OCR_MARKER_KEY = "SOCRateOCR"  # Clé du dictionnaire Info des PDF produits (date du traitement)
+
+def ensure_app_dirs():
+    os.makedirs(APP_DATA_DIR, exist_ok=True); os.makedirs(LOG_DIR, exist_ok=True)
 
 # --- ✨ BLOC CORRIGÉ : Logique Tesseract robuste pour la compilation ✨ ---
-TESSDATA_DIR_CONFIG = ''
-# Détecte si l'application est "gelée" (compilée par PyInstaller)
-is_frozen = getattr(sys, 'frozen', False)
-
-if is_frozen:
-    # --- Mode Compilé ---
-    # Le dossier de base de l'application une fois compilée
-    bundle_dir = sys._MEIPASS
-    
-    # Chemin explicite vers l'exécutable Tesseract inclus dans notre application
-    if IS_WINDOWS:
-        # Sur Windows, l'exécutable est à la racine du dossier Tesseract-OCR
-        tesseract_executable_path = os.path.join(bundle_dir, 'Tesseract-OCR', 'tesseract.exe')
-    else: # Sur macOS, il est dans un sous-dossier bin
-        tesseract_executable_path = os.path.join(bundle_dir, 'Tesseract-OCR', 'bin', 'tesseract')
-    
-    pytesseract.pytesseract.tesseract_cmd = tesseract_executable_path
-    
-    # Chemin vers le dossier des données linguistiques (tessdata)
-    if IS_WINDOWS:
-        tessdata_path = os.path.join(bundle_dir, 'Tesseract-OCR', 'tessdata')
-    else: # Pour macOS, la structure est différente
-        tessdata_path = os.path.join(bundle_dir, 'Tesseract-OCR', 'share', 'tessdata')
-    
-    # On définit la variable d'environnement pour que Tesseract trouve ses données
-    if os.path.exists(tessdata_path):
-        os.environ['TESSDATA_PREFIX'] = tessdata_path
-        TESSDATA_DIR_CONFIG = f'--tessdata-dir "{tessdata_path}"'
+TESSDATA_PATH = None
+_tesseract_configured = False
+
+def bundled_tessdata():
+    # Dossier des modèles inclus dans l'application compilée, utilisé en place ; trouvé sans importer pytesseract (lent à charger)
+    if not getattr(sys, 'frozen', False): return None
+    # Windows : Tesseract-OCR/tessdata ; macOS : Tesseract-OCR/share/tessdata
+    tessdata_path = os.path.join(sys._MEIPASS, 'Tesseract-OCR', 'tessdata') if IS_WINDOWS else os.path.join(sys._MEIPASS, 'Tesseract-OCR', 'share', 'tessdata')
+    return tessdata_path if os.path.exists(tessdata_path) else None
+
+def configure_tesseract():
+    # Recherche du binaire et des données Tesseract, faite une seule fois par processus OCR, au premier lot de pages
+    global TESSDATA_PATH, _tesseract_configured
+    if _tesseract_configured: return TESSDATA_PATH
+    _tesseract_configured = True
+    import pytesseract
+    # Détecte si l'application est "gelée" (compilée par PyInstaller)
+    if getattr(sys, 'frozen', False):
+        # --- Mode Compilé ---
+        # Le dossier de base de l'application une fois compilée
+        bundle_dir = sys._MEIPASS
+        
+        # Chemin explicite vers l'exécutable Tesseract inclus dans notre application
+        if IS_WINDOWS:
+            # Sur Windows, l'exécutable est à la racine du dossier Tesseract-OCR
+            tesseract_executable_path = os.path.join(bundle_dir, 'Tesseract-OCR', 'tesseract.exe')
+        else: # Sur macOS, il est dans un sous-dossier bin
+            tesseract_executable_path = os.path.join(bundle_dir, 'Tesseract-OCR', 'bin', 'tesseract')
+        
+        pytesseract.pytesseract.tesseract_cmd = tesseract_executable_path
+        
+        # On définit la variable d'environnement pour que Tesseract trouve ses données
+        tessdata_path = bundled_tessdata()
+        if tessdata_path:
+            os.environ['TESSDATA_PREFIX'] = tessdata_path
+            TESSDATA_PATH = tessdata_path
+        else:
+            logging.error(f"Dossier tessdata introuvable dans le bundle {bundle_dir}")
+
     else:
-        logging.error(f"Dossier tessdata introuvable dans le bundle à {tessdata_path}")
-
-else:
-    # --- Mode Développement (logique inchangée) ---
-    if IS_WINDOWS:
-        pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-    else: # macOS / Linux
-        for path in ['/opt/homebrew/bin/tesseract', '/usr/local/bin/tesseract', '/usr/bin/tesseract']:
-            if os.path.exists(path):
-                pytesseract.pytesseract.tesseract_cmd = path
-                break
+        # --- Mode Développement (logique inchangée) ---
+        if IS_WINDOWS:
+            pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+        else: # macOS / Linux
+            for path in ['/opt/homebrew/bin/tesseract', '/usr/local/bin/tesseract', '/usr/bin/tesseract']:
+                if os.path.exists(path):
+                    pytesseract.pytesseract.tesseract_cmd = path
+                    break
+    return TESSDATA_PATH
+
+def tessdata_dir_for(models):
+    # Variantes rangées à côté des modèles par défaut : <tessdata>/fast, <tessdata>/best, ou dossiers voisins tessdata_fast, tessdata_best.
+    # Variante absente : modèles par défaut (le moteur principal le signale au démarrage).
+    base = bundled_tessdata() or os.environ.get("TESSDATA_PREFIX")
+    if models == "standard" or not base: return base
+    base = base.rstrip("/\\")
+    for candidate in (os.path.join(base, models), os.path.join(os.path.dirname(base), f"tessdata_{models}")):
+        if os.path.isdir(candidate): return candidate
+    return base
+
+def valid_traineddata(path):
+    # En-tête d'une archive tessdata : nombre d'entrées (entier 32 bits) puis leurs décalages (64 bits, -1 = absente).
+    # Un fichier vide, tronqué ou d'un autre format est rejeté sans charger le modèle.
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            count = int.from_bytes(f.read(4), "little", signed=True)
+            if not 0 < count <= 64: return False
+            offsets = [int.from_bytes(f.read(8), "little", signed=True) for _ in range(count)]
+    except OSError: return False
+    return any(offset >= 0 for offset in offsets) and all(offset < size for offset in offsets)
+
+def check_tessdata(codes, models="standard"):
+    # Les modèles sont utilisés là où ils sont installés (bundle de l'application ou système) : rien n'est copié au premier lancement.
+    # Seuls ceux des langues demandées sont vérifiés, une fois : le tampon (taille, date) dispense de relire l'en-tête aux démarrages suivants.
+    # Renvoie les codes de langue introuvables ou illisibles.
+    directory = tessdata_dir_for(models)
+    if not directory: return []  # Emplacement par défaut de Tesseract : lui seul sait où chercher
+    try:
+        with open(TESSDATA_STAMP_FILE, encoding="utf-8") as f: stamp = json.load(f)
+    except (OSError, ValueError): stamp = {}
+    if stamp.get("version") != TESSDATA_STAMP_VERSION: stamp = {"version": TESSDATA_STAMP_VERSION, "files": {}}
+    missing = []; checked = False
+    for code in sorted(set(codes)):
+        path = os.path.join(directory, f"{code}.traineddata")
+        try: stat = os.stat(path)
+        except OSError: missing.append(code); continue
+        if stamp["files"].get(path) == [stat.st_size, stat.st_mtime]: continue
+        if not valid_traineddata(path): missing.append(code); continue
+        stamp["files"][path] = [stat.st_size, stat.st_mtime]; checked = True
+    if checked:
+        try:
+            ensure_app_dirs(); temp_path = f"{TESSDATA_STAMP_FILE}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f: json.dump(stamp, f)
+            os.replace(temp_path, TESSDATA_STAMP_FILE)
+        except OSError: pass  # Tampon non écrit : la vérification sera simplement refaite
+    return missing
+
+def models_installed(models):
+    # Variante de modèles réellement présente : sinon tessdata_dir_for revient aux modèles par défaut
+    return models == "standard" or tessdata_dir_for(models) != tessdata_dir_for("standard")
+
+def engine_profiles(settings=None):
+    custom = (settings or {}).get("engine_profiles") or {}
+    return {**ENGINE_PROFILES, **{name: {**ENGINE_PROFILES["Standard"], **profile} for name, profile in custom.items()}}
+
+def lang_codes(lang):
+    # "Français+English" -> "fra+eng" ; un code Tesseract inconnu de LANG_MAP (ex. "deu") est transmis tel quel
+    return "+".join(LANG_MAP.get(part.strip(), part.strip()) for part in lang.split("+"))
 
 def load_config():
     if os.path.exists(CONFIG_FILE):
@@ -111,8 +212,13 @@ def load_config():
     return {"monitored_configs": []}
 
 def save_config(data):
+    ensure_app_dirs()
     with open(CONFIG_FILE, 'w', encoding='utf-8') as f: json.dump(data, f, indent=4)
 
+def load_settings(config=None):
+    config = load_config() if config is None else config
+    return {**DEFAULT_SETTINGS, **config.get("settings", {})}
+
 def load_state():
     if os.path.exists(STATE_FILE):
         try:
@@ -120,18 +226,27 @@ def load_state():
         except (json.JSONDecodeError, AttributeError): return {}
     return {}
 
-def save_state(state_data):
-    with open(STATE_FILE, 'w', encoding='utf-8') as f: json.dump(state_data, f, indent=4)
+# Compteurs conservés dans la base SQLite (state.json n'est plus lu qu'une fois, pour la migration)
+_state_store = None
+_state_store_lock = threading.Lock()
+
+def get_state_store():
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None: ensure_app_dirs(); _state_store = StateStore(DB_FILE, load_state())
+        return _state_store
+
+def counter_should_reset(reset_interval, last_used, today):
+    last_used_date = datetime.strptime(last_used, "%Y-%m-%d").date()
+    if reset_interval == "Chaque jour": return today != last_used_date
+    if reset_interval == "Chaque mois": return today.year != last_used_date.year or today.month != last_used_date.month
+    if reset_interval == "Chaque année": return today.year != last_used_date.year
+    return False
 
 def get_next_counter(rule_path, reset_interval, padding):
-    state = load_state(); counters = state.get("counters", {}); rule_state = counters.get(rule_path, {"value": 0, "last_used": "1970-01-01"})
-    current_val = rule_state["value"]; last_used_date = datetime.strptime(rule_state["last_used"], "%Y-%m-%d").date()
-    today = datetime.now().date(); reset = False
-    if reset_interval == "Chaque jour" and today != last_used_date: reset = True
-    elif reset_interval == "Chaque mois" and (today.year != last_used_date.year or today.month != last_used_date.month): reset = True
-    elif reset_interval == "Chaque année" and today.year != last_used_date.year: reset = True
-    current_val = 1 if reset else current_val + 1; counters[rule_path] = {"value": current_val, "last_used": today.strftime("%Y-%m-%d")}
-    state["counters"] = counters; save_state(state); return str(current_val).zfill(padding)
+    today = datetime.now().date()
+    current_val = get_state_store().next_counter(rule_path, today.strftime("%Y-%m-%d"), lambda last_used: counter_should_reset(reset_interval, last_used, today))
+    return str(current_val).zfill(padding)
 
 def format_filesize(size_bytes):
     if size_bytes == 0: return "0B"
@@ -139,20 +254,36 @@ def format_filesize(size_bytes):
     while size_bytes >= p and i < len(size_name) - 1: size_bytes /= p; i += 1
     return f"{size_bytes:.1f}{size_name[i]}"
 
+def current_user_name():
+    # os.getlogin() échoue sans terminal de contrôle (service systemd, conteneur) : variables d'environnement puis base des comptes
+    import getpass
+    try: return getpass.getuser()
+    except (KeyError, OSError): return "inconnu"  # Identifiant sans compte (conteneur lancé avec un uid arbitraire)
+
 def build_dynamic_path(pattern):
-    now = datetime.now(); user_name = os.getlogin() if hasattr(os, 'getlogin') else "inconnu"; computer_name = socket.gethostname()
+    now = datetime.now(); user_name = current_user_name(); computer_name = socket.gethostname()
     replacements = {"[NOM_UTILISATEUR]": user_name, "[NOM_ORDINATEUR]": computer_name, "[DATE]": now.strftime("%Y-%m-%d")}
     path = pattern
     for token, value in replacements.items(): path = path.replace(token, value)
     return os.path.normpath(path)
 
-def build_new_filename(config, original_path, rule_path):
+def rule_output_folders(config):
+    # Dossiers remplis par la règle hors de 'Traités_OCR' (archives, sortie spécifique), reconnus quelle que soit la date :
+    # [DATE] accepte n'importe quel jour, les autres jetons sont résolus comme au déplacement
+    patterns = [config.get("archive_path_pattern") if config.get("source_action") == "Déplacer l'original" else None,
+                config.get("output_path_pattern") if config.get("output_dest_type") == "Dans un dossier spécifique" else None]
+    return [re.compile(r"\d{4}-\d{2}-\d{2}".join(re.escape(part) for part in build_dynamic_path(pattern.replace("[DATE]", "\0")).split("\0")) + r"\Z",
+                       re.IGNORECASE if IS_WINDOWS else 0) for pattern in patterns if pattern]
+
+def build_new_filename(config, original_path, rule_path, page_count=None):
     pattern = config.get("rename_pattern", "[NOM_ORIGINAL]_ocr"); original_filename = os.path.basename(original_path)
     try: file_size = format_filesize(os.path.getsize(original_path))
     except FileNotFoundError: file_size = "0B"
-    try:
-        with fitz.open(original_path) as doc: page_count = len(doc)
-    except Exception: page_count = 0
+    if page_count is None:
+        import fitz
+        try:
+            with fitz.open(original_path) as doc: page_count = len(doc)
+        except Exception: page_count = 0
     name, ext = os.path.splitext(original_filename); now = datetime.now(); reset_interval = config.get("counter_reset", "Jamais")
     try: padding = int(config.get("counter_padding", 3))
     except (ValueError, TypeError): padding = 3
@@ -161,6 +292,20 @@ def build_new_filename(config, original_path, rule_path):
     for token, value in replacements.items(): new_name = new_name.replace(token, value)
     return "".join(c for c in new_name if c.isalnum() or c in " ._-") + ext
 
+def reserve_output_name(final_path, temp_folder):
+    # Mode multi-nœud : [COMPTEUR] vient du compteur local de chaque nœud, deux nœuds peuvent produire le même nom.
+    # Le fichier temporaire, créé de façon exclusive (O_EXCL) sur le dossier partagé, réserve le nom jusqu'au déplacement du résultat ;
+    # nom pris ou résultat déjà présent : "nom_2.pdf", "nom_3.pdf"... Renvoie (chemin final, chemin temporaire).
+    folder = os.path.dirname(final_path); name, ext = os.path.splitext(os.path.basename(final_path))
+    for index in range(1, 1000):
+        filename = name + ext if index == 1 else f"{name}_{index}{ext}"
+        candidate, temp_path = os.path.join(folder, filename), os.path.join(temp_folder, filename + ".tmp")
+        try: os.close(os.open(temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError: continue
+        if not os.path.exists(candidate): return candidate, temp_path
+        os.remove(temp_path)
+    raise FileExistsError(f"aucun nom libre pour '{name}{ext}' dans '{folder}'")
+
 def open_log_folder():
     logging.info(f"Ouverture du dossier des logs : {LOG_DIR}");
     if IS_WINDOWS: os.startfile(LOG_DIR)
@@ -195,129 +340,527 @@ def is_in_startup():
         return True
     except FileNotFoundError: return False
 
+def classify_page(page):
+    import fitz
+    # Sans image, rien à reconnaître : page blanche (verso d'un recto-verso) ou page native presque vide
+    images = page.get_image_info()
+    if not images: return PAGE_TEXT, []
+    # Sans police dans les ressources, la page ne peut pas contenir de texte : inutile d'extraire quoi que ce soit
+    if not page.get_fonts(): return PAGE_IMAGE, []
+    # Texte visible uniquement : une couche invisible (render mode 3) vient d'un OCR précédent
+    visible_chars = invisible_chars = 0
+    for span in page.get_texttrace():
+        if span["type"] == 3: invisible_chars += len(span["chars"])
+        else: visible_chars += len(span["chars"])
+    if invisible_chars > MIN_TEXT_CHARS: return PAGE_TEXT, []
+    # Rectangles du texte visible existant, pour ne pas le dupliquer lors de l'insertion
+    text_rects = lambda: [fitz.Rect(word[:4]) for word in page.get_text("words")]
+    if visible_chars <= MIN_TEXT_CHARS: return PAGE_IMAGE, text_rects() if visible_chars else []
+    page_area = abs(page.rect) or 1
+    image_area = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in images)
+    if image_area / page_area < MIXED_IMAGE_COVERAGE: return PAGE_TEXT, []
+    return PAGE_MIXED, text_rects()
+
+def info_xref(document, create=False):
+    # Dictionnaire Info du PDF (référence depuis le trailer) ; 0 s'il n'existe pas et que create est faux
+    kind, value = document.xref_get_key(-1, "Info")
+    if kind == "xref": return int(value.split()[0])
+    if not create: return 0
+    xref = document.get_new_xref(); document.update_object(xref, "<<>>"); document.xref_set_key(-1, "Info", f"{xref} 0 R")
+    return xref
+
+def is_ocr_output(document):
+    xref = info_xref(document)
+    return bool(xref) and document.xref_get_key(xref, OCR_MARKER_KEY)[0] != "null"
+
+def mark_ocr_output(document):
+    # Un résultat qui revient dans un dossier surveillé (même dossier, original écrasé, règle récursive) n'est pas retraité
+    import fitz
+    document.xref_set_key(info_xref(document, create=True), OCR_MARKER_KEY, fitz.get_pdf_str(datetime.now().isoformat(timespec="seconds")))
+
+def estimate_ocr_memory(page, raster_mode="auto"):
+    # Sans rendre la page : même choix d'image native ou de résolution que le rendu des processus OCR
+    from socrate_ocr import raster_pixels
+    return raster_pixels(page, raster_mode) * OCR_BYTES_PER_PIXEL
+
+# --- Travail exécuté dans les processus OCR (doit rester au niveau du module pour être sérialisable) ---
+def count_pages(pdf_path):
+    # Seule la table des objets est lue : quelques millisecondes, même pour un document de mille pages
+    import fitz
+    try:
+        with fitz.open(pdf_path) as document: return len(document)
+    except Exception: return None
+
+def iter_pdf_files(root, recursive=False, excluded=(), skip_outputs=True, skip_folder=None):
+    # Parcours itératif (sans récursion Python) : les sous-dossiers de résultats (sauf skip_outputs=False), ceux couverts par une autre règle (excluded)
+    # et ceux pour lesquels skip_folder(chemin) est vrai (archives, sorties des règles) sont sautés
+    folders = [root]
+    while folders:
+        try: entries = list(os.scandir(folders.pop()))
+        except OSError: continue  # Sous-dossier supprimé ou inaccessible pendant le parcours
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not (skip_outputs and entry.name == OUTPUT_SUBFOLDER) and entry.path not in excluded and not (skip_folder and skip_folder(entry.path)): folders.append(entry.path)
+                elif entry.name.lower().endswith('.pdf') and entry.is_file(): yield entry
+            except OSError: continue
+
+def create_ocr_pool(max_workers, thread_limit=1):
+    # Processus lancés par "spawn" sur toutes les plateformes (comme sous Windows) : un fork pendant que d'autres threads
+    # tiennent un verrou (MuPDF, SQLite, logging) peut bloquer définitivement le processus enfant.
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_ocr_worker, initargs=(thread_limit,))
+
+def init_ocr_worker(thread_limit=1):
+    # Ctrl+C est géré par le processus principal, qui arrête proprement le pool.
+    # tesserocr est chargé d'abord : via cysignals, il installe son propre gestionnaire de SIGINT.
+    # OMP_THREAD_LIMIT est lu au chargement de Tesseract : fixé avant l'import, pour tout le processus (une valeur déjà présente est respectée).
+    import signal
+    os.environ.setdefault("OMP_THREAD_LIMIT", str(thread_limit))
+    import socrate_ocr
+    socrate_ocr.load_tesserocr()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def ocr_pages(pdf_path, page_numbers, lang, options):
+    import fitz
+    from socrate_ocr import get_backend, rasterize_page
+    # Le moteur est créé au premier appel puis conservé par le processus : modèle de langue chargé une seule fois
+    engine = options.get("engine") or ENGINE_PROFILES["Standard"]
+    configure_tesseract(); backend = get_backend(lang, options["backend"], tessdata_dir_for(engine["models"]), engine["oem"], engine["psm"], engine["threads"]); results = []
+    cache = OCRCache(options["cache_dir"], 0) if options["cache_dir"] else None
+    with fitz.open(pdf_path) as doc:
+        for page_number in page_numbers:
+            started = time.perf_counter()
+            # Image native ou rendu en niveaux de gris : le tampon brut est transmis tel quel au moteur
+            raster, to_page = rasterize_page(doc[page_number], options["raster_mode"])
+            # Même raster et mêmes réglages = même résultat : un doublon ne repasse pas par Tesseract (ni par le prétraitement)
+            text_pdf_wanted = options["text_layer"] == "tesseract"
+            cache_key = cache.key(raster, backend.name, lang, f"{engine['models']}/oem{engine['oem']}/psm{engine['psm']}", options["text_layer"], "preprocess" if options.get("preprocess") else "") if cache else None
+            ocr_data = cache.get(cache_key) if cache else None; cached = ocr_data is not None
+            if options.get("preprocess") and not cached:
+                # Raster nettoyé et réduit ; la matrice ramène ses pixels sur ceux du rendu, et est gardée avec le résultat pour le cache
+                from socrate_preprocess import preprocess_raster
+                raster, pixel_matrix = preprocess_raster(raster, deskew=not text_pdf_wanted)
+            else: pixel_matrix = None
+            rendered = time.perf_counter()
+            if not cached:
+                if text_pdf_wanted:
+                    ocr_data, pdf_bytes = backend.image_to_pdf(raster); ocr_data["text_pdf"] = base64.b64encode(pdf_bytes).decode("ascii")
+                else: ocr_data = backend.image_to_data(raster)
+                if pixel_matrix is not None: ocr_data["pixel_matrix"] = list(pixel_matrix); ocr_data["raster_size"] = [raster.width, raster.height]
+                if cache: cache.put(cache_key, ocr_data)
+            recognized = time.perf_counter()
+            if ocr_data.get("pixel_matrix"): to_page = fitz.Matrix(ocr_data["pixel_matrix"]) * to_page
+            raster_width, raster_height = ocr_data.get("raster_size") or (raster.width, raster.height)
+            # Mots regroupés par ligne Tesseract (bloc, paragraphe, ligne), dans l'ordre de lecture
+            lines = {}
+            for j in range(len(ocr_data['text'])):
+                text, conf = ocr_data['text'][j], int(ocr_data['conf'][j])
+                if conf > 60 and text.strip():
+                    x, y, w, h = ocr_data['left'][j], ocr_data['top'][j], ocr_data['width'][j], ocr_data['height'][j]
+                    rect = fitz.Rect(x, y, x + w, y + h) * to_page
+                    lines.setdefault((ocr_data['block_num'][j], ocr_data['par_num'][j], ocr_data['line_num'][j]), []).append((rect.x0, rect.y0, rect.x1, rect.y1, text))
+            # PDF texte seul de Tesseract et zone de la page affichée couverte par le raster
+            text_pdf = (base64.b64decode(ocr_data["text_pdf"]), tuple(fitz.Rect(0, 0, raster_width, raster_height) * to_page)) if ocr_data.get("text_pdf") else None
+            results.append((page_number, list(lines.values()), text_pdf, cached, rendered - started, recognized - rendered))
+    # Images décodées gardées en cache par MuPDF : vidé après chaque lot pour que la mémoire du processus reste stable
+    fitz.TOOLS.store_shrink(100)
+    return results
+
 class OCRWatcher(threading.Thread):
-    def __init__(self, configs_map, log_queue):
+    def __init__(self, configs_map, log_queue, settings=None, watch=True):
         super().__init__()
         self.configs_map = configs_map
+        # Archives et dossiers de sortie de toutes les règles : jamais parcourus, même s'ils sont sous un dossier surveillé récursivement
+        self.output_folders = [regex for config in configs_map.values() for regex in rule_output_folders(config)]
         self.log_queue = log_queue
-        self.observer = Observer()
+        # watch=False : mode lot, les fichiers présents sont traités puis le thread se termine
+        self.watch = watch
+        self.observer = None
         self.stop_event = threading.Event()
-        # --- NOUVEAUTÉ : On ne permet que 3 OCR en même temps ---
-        self.ocr_semaphore = threading.Semaphore(3)
+        # Compteurs, durées par étape et dernières tâches : exportés en JSON et, si configuré, au format Prometheus
+        self.metrics = Metrics(); self.stats = self.metrics.counters
+        self.page_latencies = deque(maxlen=10000)  # Durées rendu + OCR des dernières pages, en secondes
+        # --- Pool de processus OCR partagé : les pages de chaque document y sont réparties ---
+        settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.max_workers = int(settings["ocr_workers"]) or os.cpu_count() or 1
+        # Fichiers simultanés : entre min et max (0 = un par processus OCR, au moins 3), selon la mémoire et la charge si la régulation est active
+        self.max_jobs = int(settings["max_concurrent_files"]) or max(3, self.max_workers); self.min_jobs = min(self.max_jobs, int(settings["min_concurrent_files"]))
+        self.adaptive_concurrency = bool(settings["adaptive_concurrency"]); self.memory_reserve = int(settings["memory_reserve_mb"]) * 1024 * 1024
+        # Ordonnancement : part pondérée par règle, puis (option) le plus petit document d'abord dans chaque règle
+        self.fair_share = FairShare({path: PRIORITY_WEIGHTS.get(config.get("priority"), PRIORITY_WEIGHTS["Normale"]) for path, config in configs_map.items()})
+        self.shortest_first = bool(settings["shortest_job_first"])
+        # Profil moteur de chaque règle ; la limite de threads OpenMP vaut pour tout le pool : la plus haute des profils utilisés
+        profiles = engine_profiles(settings)
+        self.rule_engines = {path: profiles.get(config.get("engine_profile"), profiles["Standard"]) for path, config in configs_map.items()}
+        self.thread_limit = max([int(engine["threads"]) for engine in self.rule_engines.values()] or [1])
+        cache_max_bytes = int(settings["cache_max_mb"]) * 1024 * 1024
+        self.ocr_cache = OCRCache(OCR_CACHE_DIR, cache_max_bytes) if cache_max_bytes > 0 else None; self.last_cache_eviction = 0
+        # Réservé par chaque lot de pages avant son envoi au pool, libéré une fois son texte inséré
+        # memory_budget_mb = 0 : budget suivi par le régulateur d'après la mémoire disponible ; sinon c'est un plafond
+        self.memory_budget_max = int(settings["memory_budget_mb"]) * 1024 * 1024
+        self.memory_budget = MemoryBudget(self.memory_budget_max or FALLBACK_MEMORY_BUDGET_MB * 1024 * 1024); self.governor = None
+        self.metrics_interval = int(settings["metrics_interval"]); self.metrics_port = int(settings["metrics_port"]); self.metrics_exporter = None
+        self.active_jobs = 0; self.ocr_tasks_in_flight = 0
+        self.ocr_options = {"backend": settings["ocr_backend"], "raster_mode": settings["raster_mode"], "text_layer": settings["text_layer"], "cache_dir": OCR_CACHE_DIR if self.ocr_cache else None}
+        self.journal = None; self.manifest = None; self.search_index = None
+        # Mode multi-nœud : plusieurs instances sur les mêmes dossiers partagés, chaque fichier est pris sous bail par un seul nœud
+        self.leases = LeaseManager(settings["node_id"], settings["lease_ttl"], self.log) if settings["multi_node"] else None
+        # Prétraitement des pages (option de règle) : NumPy est facultatif, vérifié sans l'importer
+        self.preprocess_available = importlib.util.find_spec("numpy") is not None
+        self.job_available = threading.Condition()
+        self.pool_lock = threading.Lock()
+        self.ocr_pool = None
 
     def run(self):
+        # Les tâches vivent dans un journal SQLite : celles interrompues par un arrêt brutal reprennent au démarrage
+        ensure_app_dirs(); self.journal = JobJournal(DB_FILE); self.manifest = ScanManifest(DB_FILE)
+        recovered = self.journal.recover(self.configs_map); self.journal.purge()
+        if recovered: self.log(f"Reprise de {recovered} tâche(s) interrompue(s) lors du dernier arrêt.")
+        for models in {engine["models"] for engine in self.rule_engines.values()} - {"standard"}:
+            if tessdata_dir_for(models) == tessdata_dir_for("standard"): self.log(f"Modèles Tesseract '{models}' introuvables : les modèles par défaut sont utilisés.", "warning")
+        # Modèles de langue des règles vérifiés au démarrage, plutôt qu'un échec à chaque page
+        for models in {engine["models"] for engine in self.rule_engines.values()}:
+            codes = {code for path, config in self.configs_map.items() if self.rule_engines[path]["models"] == models for code in lang_codes(config.get("lang", "Français")).split("+")}
+            missing = check_tessdata(codes, models)
+            if missing: self.log(f"Modèle(s) de langue introuvable(s) ou illisible(s) dans {tessdata_dir_for(models)} : {', '.join(missing)}.", "error")
+        if any(config.get("search_index") for config in self.configs_map.values()):
+            if fts5_available(): self.search_index = SearchIndex(INDEX_FILE)
+            else: self.log("SQLite sans FTS5 : l'index de recherche est désactivé.", "warning")
+        if not self.preprocess_available and any(config.get("preprocess") for config in self.configs_map.values()):
+            self.log("NumPy n'est pas installé : le prétraitement des pages est ignoré.", "warning")
+        self.ocr_pool = create_ocr_pool(self.max_workers, self.thread_limit)
+        if self.leases: self.leases.start(); self.log(f"Mode multi-nœud : nœud '{self.leases.node_id}', baux de {self.leases.ttl} s.")
+        self.metrics_exporter = MetricsExporter(self.metrics, self.gauges, METRICS_FILE, self.metrics_interval, self.metrics_port, self.log); self.metrics_exporter.start()
+        self.stability_tracker = StabilityTracker(self.enqueue, self.log); self.stability_tracker.start()
+        # Un thread par créneau possible ; le régulateur décide combien travaillent à la fois
+        self.governor = ConcurrencyGovernor(self.min_jobs, self.max_jobs, self.memory_budget, self.memory_budget_max, self.memory_reserve,
+                                            lambda: self.journal.count_by_state(self.configs_map).get(JOB_QUEUED, 0), self.log, adaptive=self.adaptive_concurrency)
+        self.governor.start()
+        job_threads = [threading.Thread(target=self.job_loop, daemon=True) for _ in range(self.max_jobs)]
+        job_threads.append(threading.Thread(target=self.job_loop, args=(EXPRESS_MAX_PAGES,), daemon=True))
+        for thread in job_threads: thread.start()
+        slots = f"{self.governor.limit} fichiers simultanés, ajustés entre {self.min_jobs} et {self.max_jobs}" if self.governor.adaptive else f"{self.max_jobs} fichiers simultanés"
+        self.log(f"Moteur OCR : {self.max_workers} processus, {slots} (+1 réservé aux documents de {EXPRESS_MAX_PAGES} pages ou moins).")
         self.log("Lancement du scan des fichiers existants...")
-        for path in self.configs_map.keys():
-            try:
-                for entry in os.scandir(path):
-                    if entry.is_file() and entry.name.lower().endswith('.pdf'):
-                        self.log(f"Fichier existant trouvé : {entry.name}")
-                        threading.Thread(target=self.process_pdf, args=(entry.path,)).start()
-            except FileNotFoundError:
-                self.log(f"Le dossier {path} n'a pas été trouvé lors du scan initial.", "error")
-        self.log("Scan initial terminé. Passage en mode surveillance.")
-        event_handler = self.PDFHandler(self)
-        for path in self.configs_map.keys():
-            self.observer.schedule(event_handler, path, recursive=False)
-        self.observer.start()
-        self.stop_event.wait()
-        self.observer.stop()
-        self.observer.join()
-        self.log("Surveillance arrêtée.")
+        self.scan_existing_files()
+        if self.watch:
+            from watchdog.observers import Observer
+            self.log("Scan initial terminé. Passage en mode surveillance.")
+            self.observer = Observer(); event_handler = self.PDFHandler(self)
+            for path, config in self.configs_map.items():
+                self.observer.schedule(event_handler, path, recursive=bool(config.get("recursive")))
+            self.observer.start()
+            self.stop_event.wait()
+            self.observer.stop()
+            self.observer.join()
+        else:
+            # Mode lot : on attend que le journal ne contienne plus rien à faire pour ces règles
+            self.log("Scan initial terminé. Traitement du lot...")
+            # Vérifié avant la première attente : un lot sans rien à faire se termine aussitôt
+            while self.journal.pending_count(self.configs_map):
+                if self.stop_event.wait(0.5): break
+            self.stop_event.set()
+        self.stability_tracker.stop(); self.stability_tracker.join(); self.governor.stop()
+        with self.job_available: self.job_available.notify_all()
+        for thread in job_threads: thread.join()
+        self.ocr_pool.shutdown(wait=True, cancel_futures=True)
+        self.metrics_exporter.stop()
+        if self.leases: self.leases.stop()
+        pending = self.journal.pending_count(self.configs_map); self.journal.close(); self.manifest.close()
+        if self.search_index: self.search_index.close()
+        self.log(f"Surveillance arrêtée. {pending} fichier(s) en attente seront repris au prochain démarrage." if pending else "Surveillance arrêtée.")
+
+    def scan_existing_files(self):
+        # Seuls les fichiers nouveaux ou modifiés depuis le dernier scan (taille, date, inode) passent par le journal ;
+        # les autres ne sont ni rouverts ni réenfilés. Les tâches elles-mêmes sont exécutées par les threads habituels.
+        seen = set(); scanned_roots = []; queued = unchanged = 0
+        for path, config in self.configs_map.items():
+            if self.stop_event.is_set(): return
+            if not os.path.isdir(path):
+                self.log(f"Le dossier {path} n'a pas été trouvé lors du scan initial.", "error"); continue
+            known = self.manifest.snapshot(path); scanned_roots.append(path)
+            if self.leases: self.leases.prune(path)
+            nested_rules = {other for other in self.configs_map if other != path and other.startswith(os.path.join(path, ""))}
+            for entry in iter_pdf_files(path, config.get("recursive"), nested_rules, skip_folder=self.is_output_folder):
+                # Scan interrompu : ni manifeste incomplet élagué, ni fichier marqué sans être au journal
+                if self.stop_event.is_set(): return
+                seen.add(entry.path)
+                try: stat = entry.stat()
+                except OSError: continue
+                if known.get(entry.path) == (stat.st_size, stat.st_mtime, entry.inode()): unchanged += 1; continue
+                if self.enqueue(entry.path, path): queued += 1
+                elif self.stop_event.is_set(): return  # Refusé par l'arrêt : absent du journal, il doit être revu au prochain scan
+                # Connu du manifeste seulement une fois au journal (ou déjà présent) : c'est le journal qui garantit la reprise
+                self.manifest.record(entry.path, "queued")
+        forgotten = sum(self.manifest.forget_missing(path, seen) for path in scanned_roots)
+        self.log(f"Scan initial : {queued} fichier(s) nouveau(x) ou modifié(s) mis en file, {unchanged} inchangé(s) ignoré(s)"
+                 f"{f', {forgotten} disparu(s) retiré(s) du manifeste' if forgotten else ''}.")
+
+    def is_output_folder(self, folder):
+        return any(regex.match(folder) for regex in self.output_folders)
+
+    def rule_for(self, pdf_path):
+        # Règle qui couvre un fichier : celle de son dossier, sinon le plus proche dossier parent surveillé récursivement
+        folder = os.path.dirname(pdf_path); nested = False
+        while True:
+            config = self.configs_map.get(folder)
+            if config and (not nested or config.get("recursive")): return folder
+            if os.path.basename(folder) == OUTPUT_SUBFOLDER or self.is_output_folder(folder): return None
+            parent = os.path.dirname(folder)
+            if parent == folder: return None
+            folder = parent; nested = True
 
     def stop(self):
         self.stop_event.set()
+        with self.job_available: self.job_available.notify_all()
+
+    def enqueue(self, pdf_path, rule_path):
+        # Idempotent : un fichier déjà en file ou en cours (même chemin, taille et date) n'est pas réenfilé
+        if self.stop_event.is_set() or not self.journal.enqueue(pdf_path, rule_path, count_pages(pdf_path)): return False
+        # Tous les threads sont réveillés : celui réservé aux petits documents ne peut pas prendre n'importe quelle tâche
+        with self.job_available: self.job_available.notify_all()
+        return True
 
     def log(self, message, level="info"):
         self.log_queue.put(f"[{level.upper()}] {message}")
 
-    def pdf_has_text(self, pdf_path):
+    def job_loop(self, max_pages=None):
+        express = max_pages is not None
+        # Sélection filtrée par taille : elle ne doit pas faire perdre leur crédit aux règles dont seuls de gros fichiers attendent
+        pick = functools.partial(self.fair_share.pick, update_active=not express)
+        while self.governor.acquire(self.stop_event, express):
+            try: job = self.journal.claim(self.configs_map, pick, self.shortest_first, max_pages)
+            except Exception: self.governor.release(express); raise
+            if job is None:
+                self.governor.release(express)
+                # Rien d'exécutable : on attend un nouveau fichier ou l'échéance du prochain nouvel essai.
+                # Le thread des petits documents attend simplement : des gros fichiers prêts ne doivent pas le faire tourner à vide.
+                retry_delay = self.journal.next_retry_delay(self.configs_map) if max_pages is None else None
+                with self.job_available: self.job_available.wait(min(retry_delay, 2.0) if retry_delay is not None else 2.0)
+                continue
+            job_id, pdf_path, rule_path, pages = job; self.fair_share.charge(rule_path, pages)
+            try: self.run_job(job_id, pdf_path, rule_path)
+            finally: self.governor.release(express)
+            self.evict_cache()
+
+    def run_job(self, job_id, pdf_path, rule_path):
+        if not os.path.exists(pdf_path):
+            self.journal.fail(job_id, "fichier introuvable", retry=False); return
+        if self.leases:
+            try: state, detail = self.leases.acquire(rule_path, pdf_path)
+            except OSError as e:
+                # Partage indisponible ou droits insuffisants : la tâche reste en file, revue plus tard sans compter d'essai
+                self.log(f"Bail de '{os.path.basename(pdf_path)}' impossible à prendre ({e}) : nouvel essai plus tard.", "warning")
+                self.journal.defer(job_id, time.time() + self.leases.ttl / 4); return
+            # Fichier en cours sur un autre nœud : revu plus tard ; déjà traité ailleurs : terminé ici aussi
+            if state == LEASE_HELD: self.journal.defer(job_id, detail); return
+            if state == LEASE_DONE:
+                self.log(f"'{os.path.basename(pdf_path)}' déjà traité par le nœud '{detail.get('node', '?')}'.")
+                self.journal.complete(job_id); self.manifest.record(pdf_path, "remote"); return
+        with self.job_available: self.active_jobs += 1
+        result = None
         try:
-            with fitz.open(pdf_path) as doc:
-                return any(len(page.get_text().strip()) > 50 for page in doc)
+            result = self.process_pdf(pdf_path, rule_path)
         except Exception as e:
-            self.log(f"Impossible de vérifier le texte de {os.path.basename(pdf_path)}: {e}", "warning")
-            return False
-
-    def wait_for_file_stability(self, file_path, max_wait_time=30, check_interval=1):
-        start_time = time.time()
-        while time.time() - start_time < max_wait_time:
-            try:
-                initial_size = os.path.getsize(file_path)
-                time.sleep(check_interval)
-                current_size = os.path.getsize(file_path)
-                if initial_size == current_size:
-                    self.log(f"Le fichier '{os.path.basename(file_path)}' est stable.", "info")
-                    return True
-            except FileNotFoundError:
-                self.log(f"Le fichier '{os.path.basename(file_path)}' a disparu.", "warning")
-                return False
-        self.log(f"Le fichier '{os.path.basename(file_path)}' n'est pas devenu stable. Ignoré.", "error")
-        return False
-
-    def process_pdf(self, pdf_path):
-        with self.ocr_semaphore:
-            base_folder = os.path.dirname(pdf_path); filename = os.path.basename(pdf_path); config = self.configs_map.get(base_folder)
-            if not config: return
+            if self.stop_event.is_set() or not self.owns_lease(pdf_path): self.journal.release(job_id); return
+            if self.journal.fail(job_id, str(e)): self.log(f"'{os.path.basename(pdf_path)}' sera retenté plus tard.", "warning"); self.count("retries")
+            else: self.log(f"'{os.path.basename(pdf_path)}' abandonné après plusieurs essais.", "error"); self.count("failed"); self.manifest.record(pdf_path, "failed"); result = "failed"
+        else:
+            self.journal.complete(job_id)
+            # Original conservé ou écrasé sous le même nom : son nouvel état est mémorisé, il ne sera pas rouvert au prochain démarrage
+            if result: self.manifest.record(pdf_path, result)
+        finally:
+            with self.job_available: self.active_jobs -= 1
+            # Sans résultat (nouvel essai, arrêt), le bail est rendu : n'importe quel nœud pourra reprendre le fichier
+            if self.leases: self.leases.release(pdf_path, result)
+
+    def index_document(self, path, rule_path, pages):
+        # Un échec d'indexation ne fait pas échouer le traitement : le document pourra être réindexé (socrate index)
+        try: self.search_index.add(path, pages, rule_path)
+        except Exception as e: self.log(f"Indexation de '{os.path.basename(path)}' impossible : {e}", "warning")
+
+    def owns_lease(self, pdf_path):
+        return self.leases is None or self.leases.owns(pdf_path)
+
+    def ensure_running(self, pdf_path):
+        # Arrêt demandé ou bail repris par un autre nœud : le traitement s'interrompt avant d'écrire le résultat
+        if self.stop_event.is_set(): raise RuntimeError("surveillance arrêtée, traitement interrompu")
+        if not self.owns_lease(pdf_path): raise RuntimeError("bail repris par un autre nœud, traitement abandonné")
+
+    def count(self, key, value=1):
+        self.metrics.inc(key, value)
+
+    def gauges(self):
+        states = self.journal.count_by_state(self.configs_map)
+        with self.job_available: active_jobs, in_flight = self.active_jobs, self.ocr_tasks_in_flight
+        return {"queue_depth": states.get(JOB_QUEUED, 0), "jobs_running": active_jobs, "ocr_tasks_in_flight": in_flight,
+                "ocr_workers_busy": min(in_flight, self.max_workers), "ocr_workers": self.max_workers,
+                "memory_reserved_bytes": self.memory_budget.used, "memory_budget_bytes": self.memory_budget.max_bytes,
+                "concurrency_limit": self.governor.limit if self.governor else self.max_jobs}
+
+    def track_ocr_task(self, future):
+        with self.job_available: self.ocr_tasks_in_flight += 1
+        def done(_):
+            with self.job_available: self.ocr_tasks_in_flight -= 1
+        future.add_done_callback(done)
+        return future
+
+    def evict_cache(self):
+        if not self.ocr_cache or time.time() - self.last_cache_eviction < CACHE_EVICT_INTERVAL: return
+        self.last_cache_eviction = time.time()
+        removed, freed = self.ocr_cache.evict()
+        if removed: self.log(f"Cache OCR : {removed} entrée(s) supprimée(s), {format_filesize(freed)} libérés.")
+
+    def submit_ocr(self, *args):
+        with self.pool_lock:
+            try: return self.track_ocr_task(self.ocr_pool.submit(ocr_pages, *args))
+            except BrokenProcessPool:
+                # Un processus OCR a planté : on recrée le pool pour ne pas bloquer les fichiers suivants
+                self.log("Pool OCR interrompu, redémarrage des processus.", "warning")
+                self.ocr_pool = create_ocr_pool(self.max_workers, self.thread_limit)
+                return self.track_ocr_task(self.ocr_pool.submit(ocr_pages, *args))
+
+    def process_pdf(self, pdf_path, rule_path=None):
+        import fitz
+        from socrate_textlayer import merge_text_pdf, write_text_layer
+        base_folder = os.path.dirname(pdf_path); filename = os.path.basename(pdf_path)
+        rule_path = rule_path or self.rule_for(pdf_path); config = self.configs_map.get(rule_path)
+        if not config: return None
+        
+        self.log(f"Traitement de '{filename}'...")
+        
+        temp_output_path = ""; in_flight = {}; pdf_document = None; job = self.metrics.start_job(filename); status = "error"
+        try:
+            # Une seule ouverture par tâche : classification, nommage et sauvegarde réutilisent ce document
+            with self.metrics.timer("open", job): pdf_document = fitz.open(pdf_path); page_count = len(pdf_document)
+            job["pages"] = page_count; page_kinds = {}; existing_text = {}; page_costs = {}
+            # Document produit par sOCRate : déjà traité, même si une de ses pages est restée sans texte (image blanche)
+            produced = is_ocr_output(pdf_document)
+            with self.metrics.timer("text_check", job):
+                for page in ([] if produced else pdf_document):
+                    kind, text_rects = classify_page(page)
+                    if kind != PAGE_TEXT: page_kinds[page.number] = kind; existing_text[page.number] = text_rects; page_costs[page.number] = estimate_ocr_memory(page, self.ocr_options["raster_mode"])
+            if not page_kinds:
+                self.log(f"'{filename}' {'a déjà été traité par sOCRate' if produced else 'contient déjà du texte'}. Ignoré.", "info"); self.count("skipped"); status = "skipped"
+                # Document déjà textuel : indexé tel quel, à son emplacement
+                if self.search_index and config.get("search_index"):
+                    with self.metrics.timer("index", job): self.index_document(pdf_path, rule_path, [(page.number, *page_words(page)) for page in pdf_document])
+                return status
+            mixed_count = sum(kind == PAGE_MIXED for kind in page_kinds.values())
+            self.log(f"'{filename}' : {len(page_kinds)}/{page_count} page(s) à traiter ({mixed_count} mixte(s)), {page_count - len(page_kinds)} déjà avec texte.")
             
-            self.log(f"Traitement de '{filename}'...")
+            original_size = os.path.getsize(pdf_path)
+            new_filename = build_new_filename(config, pdf_path, config['path'], page_count)
+            output_dest_type = config.get("output_dest_type", "Dans un sous-dossier 'Traités_OCR'")
+            if output_dest_type == "Dans un dossier spécifique": output_folder = build_dynamic_path(config.get("output_path_pattern"))
+            elif output_dest_type == "Dans le même dossier que l'original": output_folder = base_folder
+            else: output_folder = os.path.join(base_folder, OUTPUT_SUBFOLDER)
+            os.makedirs(output_folder, exist_ok=True); output_path = os.path.join(output_folder, new_filename)
+            source_action = config.get("source_action", "Conserver l'original")
+            # Écraser l'original : le résultat prend la place de l'original dans son dossier, sous le nouveau nom
+            final_path = os.path.join(base_folder, new_filename) if source_action == "Écraser l'original" else output_path
+            if self.leases and final_path != pdf_path:
+                final_path, temp_output_path = reserve_output_name(final_path, output_folder)
+                if source_action != "Écraser l'original": output_path = final_path
+                if os.path.basename(final_path) != new_filename: self.log(f"Nom '{new_filename}' déjà pris : résultat de '{filename}' enregistré sous '{os.path.basename(final_path)}'.", "warning")
+            else: temp_output_path = output_path + ".tmp"
+            save_profile = config.get("save_profile", SAVE_PROFILE_OPTIONS[0])
+            if save_profile == "Incrémental" and not pdf_document.can_save_incrementally():
+                self.log(f"'{filename}' ne peut pas être complété (PDF réparé ou chiffré) : enregistrement rapide.", "warning"); save_profile = "Rapide"
+            # Incrémental : en mode "Écraser l'original", les couches texte sont ajoutées au fichier source lui-même ;
+            # sinon le source est d'abord copié tel quel dans le fichier temporaire, qui reçoit l'ajout.
+            in_place = save_profile == "Incrémental" and source_action == "Écraser l'original"
+            if save_profile == "Incrémental" and not in_place:
+                pdf_document.close(); pdf_document = None; shutil.copyfile(pdf_path, temp_output_path); pdf_document = fitz.open(temp_output_path)
             
-            if self.pdf_has_text(pdf_path):
-                self.log(f"'{filename}' contient déjà du texte. Ignoré.", "info"); return
+            # Seules les pages sans couche texte sont découpées en lots et réparties sur le pool
+            ocr_numbers = sorted(page_kinds); ocr_count = len(ocr_numbers)
+            chunk_size = max(1, min(PAGES_PER_TASK, -(-ocr_count // self.max_workers)))
+            # Un processus traite les pages d'un lot l'une après l'autre : le lot coûte autant que sa plus grosse page
+            chunks = deque((numbers, max(page_costs[n] for n in numbers)) for numbers in (ocr_numbers[start:start + chunk_size] for start in range(0, ocr_count, chunk_size)))
+            window = TASKS_IN_FLIGHT_PER_WORKER * self.max_workers; done_pages = 0
+            # Index de recherche : texte et mots reconnus gardés au fil de l'insertion, les pages déjà textuelles sont lues à l'enregistrement
+            indexing = bool(self.search_index and config.get("search_index")); ocr_words = {}
+            ocr_options = {**self.ocr_options, "preprocess": bool(config.get("preprocess")) and self.preprocess_available, "engine": self.rule_engines[rule_path]}
+            # Fenêtre glissante : un lot n'est envoyé que si le budget mémoire le permet, et ses résultats sont libérés dès l'insertion.
+            # Rendu + OCR (processus) et insertion du texte (ce thread) se recouvrent, quelle que soit la longueur du document.
+            while chunks or in_flight:
+                self.ensure_running(pdf_path)
+                while chunks and len(in_flight) < window and self.memory_budget.acquire(chunks[0][1], timeout=0 if in_flight else 0.5):
+                    numbers, cost = chunks.popleft(); in_flight[self.submit_ocr(pdf_path, numbers, lang_codes(config['lang']), ocr_options)] = cost
+                if not in_flight: continue
+                done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.memory_budget.release(in_flight.pop(future))
+                    for page_number, lines, text_pdf, cached, render_seconds, ocr_seconds in future.result():
+                        self.page_latencies.append(render_seconds + ocr_seconds)
+                        self.metrics.observe("render", render_seconds, job); self.metrics.observe("ocr", ocr_seconds, job)
+                        if cached: self.count("pages_cached")
+                        # Une couche texte par page, écrite d'un bloc ; le PDF de Tesseract ne sert que s'il n'y a pas de texte visible à préserver
+                        with self.metrics.timer("insert", job):
+                            page = pdf_document[page_number]; text_rects = existing_text[page_number]
+                            if indexing:
+                                # Mots ramenés des coordonnées affichées à celles de la page non tournée, comme pour une couche texte relue
+                                words = [(*(fitz.Rect(word[:4]) * page.derotation_matrix), word[4]) for line in lines for word in line]
+                                text = "\n".join(" ".join(word[4] for word in line) for line in lines)
+                                ocr_words[page_number] = (page.get_text() + text if text_rects else text, words)
+                            if text_pdf and not text_rects: merge_text_pdf(page, *text_pdf)
+                            else: write_text_layer(page, lines, text_rects)
+                        done_pages += 1
+                        self.log(f"   -> OCR Page {done_pages}/{ocr_count} de '{filename}'{' (cache)' if cached else ''}...")
             
-            temp_output_path = ""
-            try:
-                new_filename = build_new_filename(config, pdf_path, config['path'])
-                output_dest_type = config.get("output_dest_type", "Dans un sous-dossier 'Traités_OCR'")
-                if output_dest_type == "Dans un dossier spécifique": output_folder = build_dynamic_path(config.get("output_path_pattern"))
-                elif output_dest_type == "Dans le même dossier que l'original": output_folder = base_folder
-                else: output_folder = os.path.join(base_folder, "Traités_OCR")
-                os.makedirs(output_folder, exist_ok=True); output_path = os.path.join(output_folder, new_filename)
-                temp_output_path = output_path + ".tmp"; pdf_document = fitz.open(pdf_path)
-                
-                for i, page in enumerate(pdf_document):
-                    self.log(f"   -> OCR Page {i+1}/{len(pdf_document)} de '{filename}'...")
-                    pix = page.get_pixmap(dpi=300); img_bytes = pix.tobytes("png")
-                    ocr_data = pytesseract.image_to_data(Image.open(io.BytesIO(img_bytes)), lang=LANG_MAP[config['lang']], output_type=Output.DICT, config=TESSDATA_DIR_CONFIG)
-                    for j in range(len(ocr_data['text'])):
-                        text, conf = ocr_data['text'][j], int(ocr_data['conf'][j])
-                        if conf > 60 and text.strip():
-                            x, y, w, h = ocr_data['left'][j], ocr_data['top'][j], ocr_data['width'][j], ocr_data['height'][j]
-                            rect = fitz.Rect(x, y, x + w, y + h) / 300 * 72
-                            page.insert_text((rect.x0, rect.y1), text, fontsize=h / 300 * 72 * 0.8, render_mode=3)
-                
-                pdf_document.save(temp_output_path, garbage=4, deflate=True, clean=True); pdf_document.close()
-                original_size = os.path.getsize(pdf_path); new_size = os.path.getsize(temp_output_path)
-                size_change = (new_size / original_size - 1) * 100 if original_size > 0 else 0
-                self.log(f"'{filename}' terminé. Augmentation de taille: {size_change:+.1f}%.", "info")
-                
-                source_action = config.get("source_action", "Conserver l'original")
-                if source_action == "Écraser l'original":
-                    final_path = os.path.join(base_folder, new_filename); shutil.move(temp_output_path, final_path)
+            self.ensure_running(pdf_path); save_started = time.perf_counter()
+            index_pages = [(page.number, *(ocr_words.get(page.number) or page_words(page))) for page in pdf_document] if indexing else None
+            with self.metrics.timer("save", job):
+                mark_ocr_output(pdf_document)
+                if save_profile == "Incrémental": pdf_document.saveIncr()
+                else: pdf_document.save(temp_output_path, **SAVE_PROFILES[save_profile])
+                pdf_document.close(); pdf_document = None
+            save_seconds = time.perf_counter() - save_started; new_size = os.path.getsize(pdf_path if in_place else temp_output_path)
+            size_change = (new_size / original_size - 1) * 100 if original_size > 0 else 0
+            self.log(f"'{filename}' terminé. Enregistrement {save_profile.lower()} en {save_seconds:.2f} s, augmentation de taille: {size_change:+.1f}%.", "info")
+            
+            with self.metrics.timer("move", job):
+                if in_place:
+                    if pdf_path != final_path: shutil.move(pdf_path, final_path)
+                elif source_action == "Écraser l'original":
+                    shutil.move(temp_output_path, final_path)
                     if pdf_path != final_path: os.remove(pdf_path)
                 elif source_action == "Déplacer l'original":
                     archive_folder = build_dynamic_path(config.get("archive_path_pattern")); os.makedirs(archive_folder, exist_ok=True)
                     archive_path = os.path.join(archive_folder, filename); shutil.move(pdf_path, archive_path); shutil.move(temp_output_path, output_path)
                 elif source_action == "Conserver l'original":
                     shutil.move(temp_output_path, output_path)
+            if indexing:
+                with self.metrics.timer("index", job): self.index_document(final_path, rule_path, index_pages)
+            self.count("files"); self.count("pages", ocr_count); self.count("bytes_in", original_size); self.count("bytes_out", new_size)
+            status = "done"; job.update(ocr_pages=ocr_count, bytes_in=original_size, bytes_out=new_size, save_profile=save_profile)
+            return status
 
-            except Exception as e:
-                self.log(f"Erreur critique sur '{filename}': {e}", "error")
-            finally:
-                if os.path.exists(temp_output_path): os.remove(temp_output_path)
-
-    class PDFHandler(FileSystemEventHandler):
+        except Exception as e:
+            if self.stop_event.is_set() or not self.owns_lease(pdf_path): status = "interrupted"
+            else: self.log(f"Erreur critique sur '{filename}': {e}", "error")
+            raise
+        finally:
+            # Lots encore en vol (erreur ou arrêt) : annulés et leur réservation mémoire rendue
+            for future, cost in in_flight.items(): future.cancel(); self.memory_budget.release(cost)
+            if pdf_document is not None: pdf_document.close()
+            if os.path.exists(temp_output_path): os.remove(temp_output_path)
+            self.metrics.finish_job(job, status)
+
+    class PDFHandler:
+        # Gestionnaire d'événements watchdog (même interface que FileSystemEventHandler, sans importer watchdog à l'avance).
+        # Les événements ne font qu'alimenter le suivi de stabilité : aucun thread n'est créé par fichier
         def __init__(self, watcher):
             self.watcher = watcher
-            self.last_processed = {}
-
-        def on_created(self, event):
-            if event.is_directory or not event.src_path.lower().endswith('.pdf'): return
-            if event.src_path in self.last_processed and time.time() - self.last_processed[event.src_path] < 5: return
-            self.last_processed[event.src_path] = time.time()
-            self.watcher.log(f"Nouveau fichier détecté : {event.src_path}. Vérification...")
-            threading.Thread(target=self.check_and_process, args=(event.src_path,)).start()
-
-        def check_and_process(self, path):
-            if self.watcher.wait_for_file_stability(path):
-                threading.Thread(target=self.watcher.process_pdf, args=(path,)).start()
\ No newline at end of file
+
+        def dispatch(self, event):
+            if event.is_directory: return
+            if event.event_type in ("created", "modified"): self.track(event.src_path)
+            elif event.event_type == "moved": self.track(event.dest_path)
+
+        def track(self, path):
+            if not path.lower().endswith('.pdf'): return
+            rule_path = self.watcher.rule_for(path)
+            if rule_path and self.watcher.stability_tracker.track(path, rule_path):
+                self.watcher.log(f"Nouveau fichier détecté : {path}. Vérification...")
@@ -0,0 +1,106 @@
+# socrate_index.py
+# Index de recherche plein texte (SQLite FTS5), rempli pendant l'OCR : chemin du PDF produit, numéro de page, texte et boîtes des mots.
+# Les PDF déjà traités sont réindexés à partir de leur couche texte, sans repasser par Tesseract.
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from socrate_store import connect
+
+def fts5_available():
+    # FTS5 est compilé dans le SQLite de la plupart des distributions Python, pas de toutes
+    try:
+        with sqlite3.connect(":memory:") as db: db.execute("CREATE VIRTUAL TABLE probe USING fts5(text)")
+        return True
+    except sqlite3.OperationalError: return False
+
+def fts_query(text):
+    # Recherche simple : chaque mot doit figurer sur la page ("mot*" pour un préfixe). La syntaxe FTS5 complète passe par raw=True.
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*"); word = word.rstrip("*")
+        if word: terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+def page_words(page):
+    # Texte et mots d'une page qui a déjà sa couche texte (coordonnées de la page non tournée, comme get_text("words"))
+    return page.get_text(), [tuple(word[:5]) for word in page.get_text("words")]
+
+class SearchIndex:
+    # Une ligne par page : le texte dans la table FTS5, les boîtes des mots (JSON) dans une table ordinaire de même identifiant.
+    # Un document est identifié par son chemin, sa taille et sa date : un PDF inchangé n'est pas réindexé.
+    def __init__(self, db_path):
+        self.lock = threading.Lock(); self.db = connect(db_path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, rule TEXT, size INTEGER NOT NULL, mtime REAL NOT NULL, pages INTEGER NOT NULL, indexed REAL NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS pages (id INTEGER PRIMARY KEY, document INTEGER NOT NULL, page INTEGER NOT NULL, words TEXT NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS pages_document ON pages (document)")
+        # Accents ignorés : "resume" trouve "résumé"
+        self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5(text, tokenize = 'unicode61 remove_diacritics 2')")
+
+    def is_current(self, path):
+        try: stat = os.stat(path)
+        except FileNotFoundError: return False
+        with self.lock: row = self.db.execute("SELECT size, mtime FROM documents WHERE path = ?", (path,)).fetchone()
+        return row == (stat.st_size, stat.st_mtime)
+
+    def _delete(self, path):
+        row = self.db.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+        if not row: return False
+        self.db.execute("DELETE FROM page_text WHERE rowid IN (SELECT id FROM pages WHERE document = ?)", row)
+        self.db.execute("DELETE FROM pages WHERE document = ?", row); self.db.execute("DELETE FROM documents WHERE id = ?", row)
+        return True
+
+    def add(self, path, pages, rule=None):
+        # pages : (numéro de page, texte, [(x0, y0, x1, y1, mot), ...]) ; l'entrée précédente du même chemin est remplacée
+        stat = os.stat(path)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(path)
+                document = self.db.execute("INSERT INTO documents (path, rule, size, mtime, pages, indexed) VALUES (?, ?, ?, ?, ?, ?)",
+                                           (path, rule, stat.st_size, stat.st_mtime, len(pages), time.time())).lastrowid
+                for page_number, text, words in pages:
+                    page_id = self.db.execute("INSERT INTO pages (document, page, words) VALUES (?, ?, ?)",
+                                              (document, page_number, json.dumps([[round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1), word] for x0, y0, x1, y1, word in words], ensure_ascii=False))).lastrowid
+                    self.db.execute("INSERT INTO page_text (rowid, text) VALUES (?, ?)", (page_id, text))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK"); raise
+
+    def remove(self, path):
+        with self.lock: return self._delete(path)
+
+    def search(self, query, limit=20, raw=False):
+        # Pages trouvées, les plus pertinentes d'abord (BM25) : (chemin, numéro de page à partir de 1, extrait)
+        with self.lock:
+            return self.db.execute("SELECT documents.path, pages.page + 1, snippet(page_text, 0, '[', ']', '…', 12) FROM page_text "
+                                   "JOIN pages ON pages.id = page_text.rowid JOIN documents ON documents.id = pages.document "
+                                   "WHERE page_text MATCH ? ORDER BY rank LIMIT ?", (query if raw else fts_query(query), limit)).fetchall()
+
+    def word_boxes(self, path, page_number):
+        # Boîtes des mots d'une page (numéro à partir de 1), pour surligner un résultat dans une visionneuse
+        with self.lock:
+            row = self.db.execute("SELECT pages.words FROM pages JOIN documents ON documents.id = pages.document WHERE documents.path = ? AND pages.page = ?",
+                                  (path, page_number - 1)).fetchone()
+        return [tuple(word) for word in json.loads(row[0])] if row else []
+
+    def prune(self):
+        # Documents déplacés ou supprimés depuis leur indexation
+        with self.lock: paths = [path for path, in self.db.execute("SELECT path FROM documents")]
+        return sum(self.remove(path) for path in paths if not os.path.exists(path))
+
+    def stats(self):
+        with self.lock: return self.db.execute("SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM documents").fetchone()
+
+    def close(self):
+        with self.lock: self.db.close()
+
+def index_pdf(index, pdf_path, rule=None):
+    # Réindexation d'un PDF déjà traité : sa couche texte (OCR compris) est relue, sans nouvel OCR
+    import fitz
+    with fitz.open(pdf_path) as document: pages = [(page.number, *page_words(page)) for page in document]
+    index.add(pdf_path, pages, rule)
+    return len(pages)
@@ -0,0 +1,130 @@
+# socrate_lease.py
+# Mode multi-nœud : plusieurs instances surveillent les mêmes dossiers partagés et se répartissent les fichiers par baux.
+# Un bail est un petit fichier JSON, créé de façon atomique (O_EXCL) dans un dossier caché à la racine de la règle.
+# Son détenteur le rafraîchit (date de modification) ; un bail resté figé plus de ttl secondes vient d'un nœud arrêté ou planté et peut être repris.
+# Les horloges des nœuds doivent être synchronisées (NTP) à quelques secondes près.
+
+import os
+import json
+import time
+import socket
+import hashlib
+import threading
+
+LEASE_FOLDER = ".socrate_leases"
+LEASE_ACQUIRED, LEASE_HELD, LEASE_DONE = "acquired", "held", "done"
+FINISHED_STATES = ("done", "skipped", "failed")  # Bail conservé comme marque de fin : les autres nœuds ne rouvrent pas le fichier
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def read_lease(lease_path):
+    try:
+        with open(lease_path, encoding="utf-8") as f: return json.load(f)
+    except (OSError, ValueError): return {}  # Bail en cours d'écriture ou disparu : seule sa date compte
+
+class LeaseManager(threading.Thread):
+    # Baux détenus par ce nœud, rafraîchis par un seul thread. Un bail repris par un autre nœud est marqué perdu :
+    # le traitement correspondant s'interrompt avant d'écrire quoi que ce soit.
+    def __init__(self, node_id=None, ttl=120, log=None):
+        super().__init__(daemon=True)
+        self.node_id = node_id or default_node_id(); self.ttl = max(10, int(ttl)); self.log = log or (lambda message, level="info": None)
+        self.lock = threading.Lock(); self.held = {}; self.lost = set()  # Chemin du PDF -> (chemin du bail, chemin relatif)
+        self.stop_event = threading.Event()
+
+    @staticmethod
+    def lease_path(root, pdf_path):
+        # Nom tiré du chemin relatif à la racine de la règle : identique sur chaque nœud, quel que soit le point de montage du partage
+        relative = os.path.relpath(pdf_path, root).replace(os.sep, "/")
+        return os.path.join(root, LEASE_FOLDER, hashlib.sha1(relative.encode("utf-8")).hexdigest() + ".lease"), relative
+
+    def acquire(self, root, pdf_path):
+        # (LEASE_ACQUIRED, None) ; (LEASE_HELD, date du prochain essai) si un autre nœud traite le fichier ; (LEASE_DONE, bail) s'il l'a déjà traité
+        lease_path, relative = self.lease_path(root, pdf_path)
+        os.makedirs(os.path.dirname(lease_path), exist_ok=True)
+        for _ in range(3):
+            try: fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError: pass
+            else:
+                with os.fdopen(fd, "w", encoding="utf-8") as f: json.dump({"node": self.node_id, "file": relative, "state": "running", "started": time.time()}, f)
+                with self.lock: self.held[pdf_path] = (lease_path, relative); self.lost.discard(pdf_path)
+                return LEASE_ACQUIRED, None
+            lease = read_lease(lease_path)
+            try: heartbeat = os.stat(lease_path).st_mtime
+            except FileNotFoundError: continue  # Libéré entre-temps
+            if lease.get("state") in FINISHED_STATES:
+                try: stat = os.stat(pdf_path)
+                except FileNotFoundError: return LEASE_DONE, lease
+                if [lease.get("size"), lease.get("mtime")] == [stat.st_size, stat.st_mtime]: return LEASE_DONE, lease
+                # Fichier remplacé depuis : la marque de fin ne vaut plus, elle est reprise
+            elif heartbeat + self.ttl > time.time():
+                # Revérifié au plus tard au quart du délai : la fin du traitement sur l'autre nœud est vue sans attendre l'expiration
+                return LEASE_HELD, min(heartbeat + self.ttl, time.time() + self.ttl / 4)
+            if not self.take_over(lease_path): break
+        return LEASE_HELD, time.time() + self.ttl / 4
+
+    def take_over(self, lease_path):
+        # Renommage atomique vers un nom propre à ce nœud : un seul nœud récupère un bail expiré. Si le bail a été recréé
+        # entre la lecture et le renommage, il est remis en place (lien sans écrasement) et la reprise est abandonnée.
+        private = f"{lease_path}.{self.node_id}.{threading.get_ident()}"
+        try: os.rename(lease_path, private)
+        except FileNotFoundError: return True
+        try:
+            if read_lease(private).get("state") == "running" and os.stat(private).st_mtime + self.ttl > time.time():
+                try: os.link(private, lease_path)
+                except OSError: pass
+                return False
+            return True
+        finally:
+            try: os.remove(private)
+            except OSError: pass
+
+    def owns(self, pdf_path):
+        with self.lock: return pdf_path in self.held and pdf_path not in self.lost
+
+    def release(self, pdf_path, result=None):
+        # Avec un résultat, le bail devient une marque de fin liée à la taille et à la date du fichier (un fichier remplacé sera retraité).
+        # Sans résultat (nouvel essai, arrêt) ou si le fichier a quitté le dossier, le bail est supprimé : le fichier redevient disponible.
+        with self.lock:
+            lease_path, relative = self.held.pop(pdf_path, (None, None)); lost = pdf_path in self.lost; self.lost.discard(pdf_path)
+        if lease_path is None or lost: return  # Bail perdu : il appartient désormais à un autre nœud
+        try:
+            if result:
+                stat = os.stat(pdf_path); temp_path = f"{lease_path}.{self.node_id}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump({"node": self.node_id, "file": relative, "state": result, "size": stat.st_size, "mtime": stat.st_mtime, "finished": time.time()}, f)
+                os.replace(temp_path, lease_path); return
+        except FileNotFoundError: pass
+        try: os.remove(lease_path)
+        except FileNotFoundError: pass
+
+    def prune(self, root):
+        # Au scan : marques de fin des fichiers disparus et restes de reprises interrompues sont supprimés
+        folder = os.path.join(root, LEASE_FOLDER); removed = 0
+        if not os.path.isdir(folder): return 0
+        for entry in os.scandir(folder):
+            try:
+                if entry.name.endswith(".lease"):
+                    lease = read_lease(entry.path)
+                    if lease.get("state") not in FINISHED_STATES or os.path.exists(os.path.join(root, *lease.get("file", "").split("/"))): continue
+                elif entry.stat().st_mtime + self.ttl > time.time(): continue
+                os.remove(entry.path); removed += 1
+            except OSError: pass
+        return removed
+
+    def run(self):
+        while not self.stop_event.wait(self.ttl / 4):
+            with self.lock: held = dict(self.held)
+            for pdf_path, (lease_path, _) in held.items():
+                lease = read_lease(lease_path)
+                if lease.get("node") == self.node_id:
+                    try: os.utime(lease_path); continue
+                    except OSError: pass
+                elif not lease and os.path.exists(lease_path): continue  # Illisible pour l'instant (écriture en cours) : vu au tour suivant
+                with self.lock:
+                    if pdf_path not in self.held: continue  # Libéré pendant la vérification
+                    self.lost.add(pdf_path)
+                self.log(f"Bail de '{os.path.basename(pdf_path)}' perdu : le fichier a été repris par un autre nœud.", "warning")
+
+    def stop(self):
+        self.stop_event.set()
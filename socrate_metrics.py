@@ -0,0 +1,131 @@
+# socrate_metrics.py
+# Mesures structurées du moteur : durées par étape, compteurs et jauges, exportés en JSON et au format texte Prometheus
+
+import os
+import json
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# --- Étapes d'un traitement, dans l'ordre d'exécution ---
+STAGES = ["open", "text_check", "render", "ocr", "insert", "save", "move", "index"]
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)  # Bornes des histogrammes de durée, en secondes
+COUNTERS = {
+    "files": "Fichiers traités", "pages": "Pages passées à l'OCR", "pages_cached": "Pages servies par le cache OCR",
+    "skipped": "Fichiers ignorés (texte déjà présent)", "failed": "Fichiers abandonnés après plusieurs essais", "retries": "Échecs suivis d'un nouvel essai",
+    "bytes_in": "Octets des PDF source traités", "bytes_out": "Octets des PDF produits",
+}
+GAUGES = {
+    "queue_depth": "Fichiers en attente dans le journal", "jobs_running": "Fichiers en cours de traitement",
+    "ocr_tasks_in_flight": "Lots de pages envoyés au pool OCR et non terminés", "ocr_workers_busy": "Processus OCR occupés", "ocr_workers": "Taille du pool OCR",
+    "memory_reserved_bytes": "Mémoire réservée par les pages en cours d'OCR", "memory_budget_bytes": "Budget mémoire des pages (ajusté par le régulateur)",
+    "concurrency_limit": "Fichiers traités simultanément autorisés par le régulateur",
+}
+
+class Metrics:
+    # Tout est protégé par un seul verrou : les mises à jour sont rares comparées au coût d'une page
+    def __init__(self, recent_jobs=50):
+        self.lock = threading.Lock(); self.started = time.time()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.stages = {stage: {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)} for stage in STAGES}
+        self.recent_jobs = deque(maxlen=recent_jobs)
+
+    def inc(self, key, value=1):
+        with self.lock: self.counters[key] += value
+
+    def observe(self, stage, seconds, job=None):
+        with self.lock:
+            entry = self.stages[stage]; entry["count"] += 1; entry["sum"] += seconds; entry["max"] = max(entry["max"], seconds)
+            index = bisect.bisect_left(BUCKETS, seconds)
+            if index < len(BUCKETS): entry["buckets"][index] += 1
+            if job is not None: job["stages"][stage] = job["stages"].get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage, job=None):
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(stage, time.perf_counter() - start, job)
+
+    def start_job(self, filename):
+        return {"file": filename, "started": time.time(), "stages": {}, "clock": time.perf_counter()}
+
+    def finish_job(self, job, status, **fields):
+        job.update(fields, status=status, seconds=round(time.perf_counter() - job.pop("clock"), 3))
+        job["stages"] = {stage: round(seconds, 3) for stage, seconds in job["stages"].items()}
+        with self.lock: self.recent_jobs.append(job)
+
+    def snapshot(self, gauges=None):
+        with self.lock:
+            return {"timestamp": time.time(), "uptime": round(time.time() - self.started, 1), "counters": dict(self.counters), "gauges": dict(gauges or {}),
+                    "stages": {stage: {"count": entry["count"], "seconds": round(entry["sum"], 3), "max": round(entry["max"], 3),
+                                       "avg": round(entry["sum"] / entry["count"], 4) if entry["count"] else 0.0} for stage, entry in self.stages.items()},
+                    "recent_jobs": list(self.recent_jobs)}
+
+    def prometheus(self, gauges=None):
+        # Format texte d'exposition Prometheus (version 0.0.4)
+        lines = []
+        with self.lock:
+            for key, help_text in COUNTERS.items():
+                lines += [f"# HELP socrate_{key}_total {help_text}", f"# TYPE socrate_{key}_total counter", f"socrate_{key}_total {self.counters[key]}"]
+            lines += ["# HELP socrate_stage_seconds Durée de chaque étape du traitement", "# TYPE socrate_stage_seconds histogram"]
+            for stage, entry in self.stages.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, entry["buckets"]):
+                    cumulative += count; lines.append(f'socrate_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines += [f'socrate_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {entry["count"]}',
+                          f'socrate_stage_seconds_sum{{stage="{stage}"}} {entry["sum"]:.6f}', f'socrate_stage_seconds_count{{stage="{stage}"}} {entry["count"]}']
+            uptime = time.time() - self.started
+        for key, value in (gauges or {}).items():
+            lines += [f"# HELP socrate_{key} {GAUGES.get(key, key)}", f"# TYPE socrate_{key} gauge", f"socrate_{key} {value}"]
+        lines += ["# HELP socrate_uptime_seconds Durée depuis le démarrage du moteur", "# TYPE socrate_uptime_seconds gauge", f"socrate_uptime_seconds {uptime:.1f}"]
+        return "\n".join(lines) + "\n"
+
+class MetricsExporter(threading.Thread):
+    # Écrit périodiquement le fichier JSON et, si un port est configuré, sert /metrics sur 127.0.0.1 (local uniquement)
+    def __init__(self, metrics, gauges, json_path, interval=15, port=0, log=None):
+        super().__init__(daemon=True)
+        self.metrics = metrics; self.gauges = gauges; self.json_path = json_path
+        self.interval = max(1, interval); self.port = int(port or 0); self.log = log or (lambda message, level="info": None)
+        self.stop_event = threading.Event(); self.server = None
+
+    def run(self):
+        if self.port:
+            # Serveur HTTP importé seulement s'il est configuré : son import (email, http.client...) pèse sur le démarrage
+            from http.server import ThreadingHTTPServer
+            try:
+                self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self.handler_class()); self.server.daemon_threads = True
+                threading.Thread(target=self.server.serve_forever, daemon=True).start()
+                self.log(f"Métriques Prometheus disponibles sur http://127.0.0.1:{self.port}/metrics")
+            except OSError as e:
+                self.log(f"Impossible d'ouvrir le port des métriques {self.port} : {e}", "warning")
+        while not self.stop_event.wait(self.interval): self.write_json()
+
+    def stop(self):
+        # Dernière écriture pour que le fichier reflète l'état final, une fois le thread terminé (pas deux écritures en même temps)
+        self.stop_event.set()
+        if self.ident is not None and self is not threading.current_thread(): self.join()
+        self.write_json()
+        if self.server: self.server.shutdown(); self.server.server_close()
+
+    def write_json(self):
+        try:
+            temp_path = f"{self.json_path}.{os.getpid()}.tmp"  # L'interface et la ligne de commande peuvent partager le même fichier
+            with open(temp_path, "w", encoding="utf-8") as f: json.dump(self.metrics.snapshot(self.gauges()), f, indent=4)
+            os.replace(temp_path, self.json_path)
+        except Exception as e:
+            self.log(f"Écriture des métriques impossible : {e}", "warning")
+
+    def handler_class(self):
+        from http.server import BaseHTTPRequestHandler
+        exporter = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics": self.send_error(404); return
+                body = exporter.metrics.prometheus(exporter.gauges()).encode("utf-8")
+                self.send_response(200); self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body))); self.end_headers(); self.wfile.write(body)
+
+            def log_message(self, *args): pass
+        return Handler
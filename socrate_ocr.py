@@ -0,0 +1,198 @@
+# socrate_ocr.py
+
+import os
+import atexit
+import shutil
+import tempfile
+import subprocess
+
+import fitz  # PyMuPDF
+
+# --- Dépendance optionnelle : liaison directe à l'API C de Tesseract ---
+# Chargée par les processus OCR seulement : tesserocr installe ses gestionnaires de signaux à l'import, et le processus
+# principal n'utilise ici que le calcul du rendu (estimation mémoire). pytesseract est importé de même à son premier appel.
+tesserocr = False
+
+def load_tesserocr():
+    global tesserocr
+    if tesserocr is False:
+        try: import tesserocr
+        except ImportError: tesserocr = None
+    return tesserocr
+
+OCR_BACKEND_OPTIONS = ["auto", "tesserocr", "pytesseract"]
+# "auto" : image intégrée extraite à sa résolution native quand la page n'est qu'un scan, DPI adaptatif sinon
+RASTER_MODE_OPTIONS = ["auto", "300dpi"]
+TARGET_DPI = 300
+MIN_DPI = 150  # En dessous, Tesseract perd en précision : on rend la page plutôt que d'extraire l'image
+MAX_NATIVE_DPI = 400  # Au-delà, rendre à TARGET_DPI coûte moins de pixels que l'image d'origine
+MAX_RENDER_PIXELS = 12_000_000  # Plafond de pixels par page rendue (A3 et plus grands formats)
+SINGLE_IMAGE_COVERAGE = 0.9
+TSV_COLUMNS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num", "left", "top", "width", "height", "conf", "text"]
+
+def parse_tsv(tsv):
+    # Même structure que pytesseract.image_to_data(output_type=Output.DICT)
+    data = {column: [] for column in TSV_COLUMNS}
+    for line in tsv.splitlines():
+        fields = line.split("\t")
+        if len(fields) < len(TSV_COLUMNS) or not fields[0].isdigit(): continue
+        for column, value in zip(TSV_COLUMNS[:-2], fields): data[column].append(int(value))
+        data["conf"].append(float(fields[10])); data["text"].append(fields[11])
+    return data
+
+class Raster:
+    # Page rendue en niveaux de gris 8 bits : on garde le tampon brut du Pixmap, sans passer par un PNG
+    __slots__ = ("samples", "width", "height", "stride", "dpi", "owner")
+
+    def __init__(self, samples, width, height, stride, dpi, owner=None):
+        self.samples = samples; self.width = width; self.height = height; self.stride = stride; self.dpi = dpi; self.owner = owner
+
+    @classmethod
+    def from_pixmap(cls, pix, dpi):
+        # samples_mv est une vue sur la mémoire du Pixmap : on conserve le Pixmap pour qu'elle reste valide
+        return cls(pix.samples_mv, pix.width, pix.height, pix.stride, dpi, owner=pix)
+
+    def tobytes(self):
+        return self.samples if isinstance(self.samples, bytes) else bytes(self.samples)
+
+    def to_pnm(self):
+        # PGM binaire (P5) : un en-tête de quelques octets devant les pixels, aucune compression
+        header = f"P5\n{self.width} {self.height}\n255\n".encode("ascii")
+        if self.stride == self.width: return header + self.tobytes()
+        rows = memoryview(self.samples)
+        return header + b"".join(rows[y * self.stride:y * self.stride + self.width] for y in range(self.height))
+
+def native_image_info(page):
+    # Page de scanner : une seule image, sans masque, couvrant la page et posée droite après rotation de la page.
+    # (description de l'image, matrice vers la page affichée, DPI) sans extraire l'image ; None si la page doit être rendue
+    infos = page.get_image_info(xrefs=True)
+    if len(infos) != 1 or not infos[0]["xref"] or infos[0]["has-mask"]: return None
+    info = infos[0]; page_rect = page.rect * page.derotation_matrix
+    if abs(fitz.Rect(info["bbox"]) & page_rect) < SINGLE_IMAGE_COVERAGE * abs(page_rect): return None
+    # Pixel de l'image -> carré unité -> page non tournée -> page telle qu'affichée
+    matrix = fitz.Matrix(1 / info["width"], 0, 0, 1 / info["height"], 0, 0) * fitz.Matrix(info["transform"]) * page.rotation_matrix
+    if abs(matrix.b) > 1e-6 or abs(matrix.c) > 1e-6 or matrix.a <= 0 or matrix.d <= 0: return None
+    dpi = 72 / max(matrix.a, matrix.d)
+    if not MIN_DPI <= dpi <= MAX_NATIVE_DPI: return None
+    return info, matrix, dpi
+
+def native_image(page):
+    found = native_image_info(page)
+    if not found: return None
+    info, matrix, dpi = found
+    pix = fitz.Pixmap(page.parent, info["xref"])
+    if pix.alpha: pix = fitz.Pixmap(pix, 0)
+    if pix.n != 1: pix = fitz.Pixmap(fitz.csGRAY, pix)
+    if (pix.width, pix.height) != (info["width"], info["height"]): return None
+    return Raster.from_pixmap(pix, dpi), matrix
+
+def adaptive_dpi(page):
+    # Inutile de rendre plus finement que les images de la page, ni de dépasser le plafond de pixels
+    dpi = TARGET_DPI
+    image_dpis = [info["width"] * 72 / fitz.Rect(info["bbox"]).width for info in page.get_image_info() if fitz.Rect(info["bbox"]).width > 0]
+    if image_dpis: dpi = min(dpi, max(image_dpis))
+    area_in2 = page.rect.width * page.rect.height / 72 ** 2
+    if area_in2 > 0: dpi = min(dpi, (MAX_RENDER_PIXELS / area_in2) ** 0.5)
+    return max(MIN_DPI, int(dpi))
+
+def render_dpi(page, mode="auto"):
+    # Résolution du rendu quand la page n'est pas une image native ; MIN_DPI prime sur le plafond de pixels (grands formats)
+    return adaptive_dpi(page) if mode == "auto" else TARGET_DPI
+
+def raster_pixels(page, mode="auto"):
+    # Taille du raster que rasterize_page produira, sans rendre la page ni extraire l'image : base de l'estimation mémoire de l'OCR
+    if mode == "auto":
+        try: native = native_image_info(page)
+        except Exception: native = None
+        if native: return native[0]["width"] * native[0]["height"]
+    return int(abs(page.rect) / 72 ** 2 * render_dpi(page, mode) ** 2)
+
+def rasterize_page(page, mode="auto"):
+    # Renvoie le raster à OCR et la matrice qui ramène ses pixels dans l'espace de la page affichée
+    if mode == "auto":
+        try: native = native_image(page)
+        except Exception: native = None
+        if native: return native
+    dpi = render_dpi(page, mode)
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return Raster.from_pixmap(pix, dpi), fitz.Matrix(page.rect.width / pix.width, page.rect.height / pix.height)
+
+class TesserocrBackend:
+    # Moteur Tesseract chargé une seule fois dans le processus : les modèles de langue restent en mémoire entre les pages
+    name = "tesserocr"
+
+    def __init__(self, lang, tessdata_dir=None, oem=3, psm=3, threads=1):
+        # threads : sans effet ici, OMP_THREAD_LIMIT est fixé pour tout le processus au démarrage du pool
+        kwargs = {"lang": lang, "oem": oem, "psm": psm}
+        if tessdata_dir: kwargs["path"] = os.path.join(tessdata_dir, "")
+        self.api = load_tesserocr().PyTessBaseAPI(**kwargs)
+
+        self.work_dir = None
+
+    def image_to_data(self, raster):
+        # L'API copie le tampon une fois en mémoire, sans encodage intermédiaire
+        self.api.SetImageBytes(raster.tobytes(), raster.width, raster.height, 1, raster.stride)
+        self.api.SetSourceResolution(int(raster.dpi))
+        return parse_tsv(self.api.GetTSVText(0))
+
+    def image_to_pdf(self, raster):
+        # Une seule reconnaissance pour le PDF texte seul et le TSV ; le moteur de rendu PDF de Tesseract lit un fichier image
+        if self.work_dir is None: self.work_dir = tempfile.mkdtemp(prefix="socrate_ocr_")
+        image_path = os.path.join(self.work_dir, "page.pgm"); output_base = os.path.join(self.work_dir, "page")
+        with open(image_path, "wb") as f: f.write(raster.to_pnm())
+        for name, value in (("tessedit_create_pdf", "1"), ("textonly_pdf", "1"), ("user_defined_dpi", str(int(raster.dpi)))): self.api.SetVariable(name, value)
+        if not self.api.ProcessPages(output_base, image_path): raise RuntimeError("tesseract n'a pas produit de PDF")
+        with open(output_base + ".pdf", "rb") as f: pdf_bytes = f.read()
+        return parse_tsv(self.api.GetTSVText(0)), pdf_bytes
+
+    def close(self):
+        self.api.End()
+        if self.work_dir: shutil.rmtree(self.work_dir, ignore_errors=True)
+
+class PytesseractBackend:
+    # Repli : un processus tesseract par page (binaire configuré via pytesseract.tesseract_cmd).
+    # L'image est envoyée en PNM sur l'entrée standard et le TSV lu sur la sortie : ni PNG, ni fichier temporaire.
+    name = "pytesseract"
+
+    def __init__(self, lang, tessdata_dir=None, oem=3, psm=3, threads=1):
+        self.lang = lang; self.tessdata_dir = tessdata_dir; self.oem = oem; self.psm = psm
+        self.env = {**os.environ, "OMP_THREAD_LIMIT": str(threads)}  # Un processus tesseract par page : limite propre à chaque appel
+
+    def run(self, raster, output, *args):
+        import pytesseract
+        command = [pytesseract.pytesseract.tesseract_cmd, "stdin", output, "-l", self.lang, "--dpi", str(int(raster.dpi)), "--oem", str(self.oem), "--psm", str(self.psm)]
+        if self.tessdata_dir: command += ["--tessdata-dir", self.tessdata_dir]
+        result = subprocess.run(command + list(args), input=raster.to_pnm(), capture_output=True, env=self.env, creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        if result.returncode != 0: raise RuntimeError(f"tesseract a échoué : {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout
+
+    def image_to_data(self, raster):
+        return parse_tsv(self.run(raster, "stdout", "tsv").decode("utf-8"))
+
+    def image_to_pdf(self, raster):
+        # PDF texte seul et TSV écrits côte à côte par le même appel (une seule reconnaissance)
+        work_dir = tempfile.mkdtemp(prefix="socrate_ocr_"); output_base = os.path.join(work_dir, "page")
+        try:
+            self.run(raster, output_base, "-c", "textonly_pdf=1", "pdf", "tsv")
+            with open(output_base + ".pdf", "rb") as f: pdf_bytes = f.read()
+            with open(output_base + ".tsv", encoding="utf-8") as f: return parse_tsv(f.read()), pdf_bytes
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def close(self):
+        pass
+
+# Un moteur par (backend, langue, modèles, OEM, PSM, threads) et par processus de travail, réutilisé pour toutes les pages
+_backends = {}
+
+def get_backend(lang, preferred="auto", tessdata_dir=None, oem=3, psm=3, threads=1):
+    use_tesserocr = preferred in ("auto", "tesserocr") and load_tesserocr() is not None
+    key = ("tesserocr" if use_tesserocr else "pytesseract", lang, tessdata_dir, oem, psm, threads)
+    if key not in _backends:
+        backend_class = TesserocrBackend if use_tesserocr else PytesseractBackend
+        _backends[key] = backend_class(lang, tessdata_dir, oem, psm, threads)
+    return _backends[key]
+
+@atexit.register
+def close_backends():
+    while _backends: _backends.popitem()[1].close()
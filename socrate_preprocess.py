@@ -0,0 +1,136 @@
+# socrate_preprocess.py
+# Prétraitement optionnel des pages avant l'OCR (option "preprocess" d'une règle), vectorisé avec NumPy sur le tampon du raster :
+# redressement, recadrage des bords, réduction vers une hauteur d'x cible et binarisation adaptative.
+# Chaque étape est une transformation affine des pixels : la matrice renvoyée ramène les mots reconnus sur les pixels du rendu d'origine.
+
+import fitz  # PyMuPDF
+
+from socrate_ocr import Raster
+
+# --- Dépendance optionnelle : sans NumPy, les pages partent telles quelles à Tesseract ---
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ANALYSIS_DPI = 75  # Résolution de l'image d'analyse utilisée pour mesurer l'inclinaison
+MAX_SKEW_DEGREES = 5.0
+MIN_SKEW_DEGREES = 0.3  # En dessous, Tesseract s'en accommode : pas de redressement
+TARGET_X_HEIGHT = 20  # Hauteur d'x (pixels) au-delà de laquelle Tesseract ne gagne plus en précision
+MIN_DPI = 150  # La réduction ne descend pas sous cette résolution
+DARK_BORDER = 0.8  # Ligne ou colonne de bord à plus de 80 % sombre : bord noir du scanner
+BINARIZE_SENSITIVITY = 0.15  # Un pixel est de l'encre s'il est 15 % plus sombre que la moyenne de son voisinage (Bradley)
+
+def available():
+    return numpy is not None
+
+def otsu_threshold(image):
+    # Seuil global séparant encre et fond, calculé sur l'histogramme : sert uniquement aux mesures
+    histogram = numpy.bincount(image.ravel(), minlength=256).astype(numpy.float64)
+    levels = numpy.arange(256); weight = numpy.cumsum(histogram); mass = numpy.cumsum(histogram * levels)
+    background = weight[-1] - weight
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        variance = numpy.nan_to_num((mass[-1] * weight - mass * weight[-1]) ** 2 / (weight * background))
+    return int(numpy.argmax(variance[:-1])) + 1
+
+def estimate_skew(ink):
+    # Angle qui rend le profil horizontal de l'encre le plus contrasté (lignes de texte alignées sur des lignes de pixels)
+    ys, xs = numpy.nonzero(ink)
+    if len(xs) < 100: return 0.0
+    def score(angles):
+        scores = []
+        for angle in angles:
+            rows = numpy.round(ys - xs * numpy.tan(numpy.radians(angle))).astype(numpy.int64); rows -= rows.min()
+            scores.append(float((numpy.bincount(rows).astype(numpy.float64) ** 2).sum()))
+        return angles[int(numpy.argmax(scores))]
+    coarse = score(numpy.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + 0.01, 0.5))
+    return float(score(numpy.arange(coarse - 0.5, coarse + 0.51, 0.1)))
+
+def shear_columns(image, slope):
+    # Redressement par cisaillement vertical : chaque bande de colonnes est décalée d'un bloc (au plus quelques centaines de copies)
+    height, width = image.shape; output = numpy.full_like(image, 255)
+    shifts = numpy.round(numpy.arange(width) * slope).astype(numpy.int64)
+    edges = numpy.flatnonzero(numpy.diff(shifts)) + 1
+    for start, stop in zip(numpy.r_[0, edges], numpy.r_[edges, width]):
+        shift = int(shifts[start])
+        # Pixel redressé (x, y) <- pixel d'origine (x, y + shift)
+        if shift >= 0: output[:height - shift, start:stop] = image[shift:, start:stop]
+        else: output[-shift:, start:stop] = image[:height + shift, start:stop]
+    return output
+
+def dark_borders(ink):
+    # Bandes presque entièrement sombres sur les bords (fond du capot du scanner) : (gauche, haut, droite, bas) de la zone utile
+    height, width = ink.shape
+    rows = ink.mean(axis=1); columns = ink.mean(axis=0)
+    top, bottom, left, right = 0, height, 0, width
+    while top < bottom and rows[top] > DARK_BORDER: top += 1
+    while bottom > top and rows[bottom - 1] > DARK_BORDER: bottom -= 1
+    while left < right and columns[left] > DARK_BORDER: left += 1
+    while right > left and columns[right - 1] > DARK_BORDER: right -= 1
+    return left, top, right, bottom
+
+def content_box(ink, margin):
+    # Boîte englobant l'encre, plus une marge ; quelques pixels isolés ne comptent pas
+    row_ink = numpy.flatnonzero(ink.sum(axis=1) >= 3); column_ink = numpy.flatnonzero(ink.sum(axis=0) >= 3)
+    if not len(row_ink) or not len(column_ink): return None
+    height, width = ink.shape
+    return (max(0, int(column_ink[0]) - margin), max(0, int(row_ink[0]) - margin),
+            min(width, int(column_ink[-1]) + 1 + margin), min(height, int(row_ink[-1]) + 1 + margin))
+
+def estimate_x_height(ink):
+    # Dans chaque ligne de texte (suite de lignes de pixels avec encre), la bande la plus dense correspond à la hauteur d'x
+    profile = ink.sum(axis=1); has_ink = profile > max(2, ink.shape[1] // 200)
+    changes = numpy.flatnonzero(numpy.diff(numpy.r_[0, has_ink.astype(numpy.int8), 0]))
+    heights = []
+    for start, stop in zip(changes[::2], changes[1::2]):
+        line = profile[start:stop]
+        if stop - start >= 4: heights.append(int((line >= line.max() / 2).sum()))
+    return float(numpy.median(heights)) if heights else None
+
+def binarize(image, window, band=256):
+    # Seuil adaptatif de Bradley : moyenne locale (fenêtre window x window) par sommes cumulées, insensible à l'éclairage et aux fonds colorés.
+    # Traité par bandes de lignes : la mémoire supplémentaire reste de l'ordre de l'image elle-même.
+    height, width = image.shape; half = window // 2; output = numpy.empty_like(image)
+    y0 = numpy.clip(numpy.arange(height) - half, 0, height); y1 = numpy.clip(numpy.arange(height) + half + 1, 0, height)
+    x0 = numpy.clip(numpy.arange(width) - half, 0, width); x1 = numpy.clip(numpy.arange(width) + half + 1, 0, width)
+    ratio = round(100 * (1 - BINARIZE_SENSITIVITY))
+    for start in range(0, height, band):
+        stop = min(height, start + band); first = y0[start]
+        # Sommes cumulées verticales limitées aux lignes dont la bande a besoin
+        columns = numpy.zeros((y1[stop - 1] - first + 1, width), dtype=numpy.uint32); numpy.cumsum(image[first:y1[stop - 1]], axis=0, dtype=numpy.uint32, out=columns[1:])
+        vertical = columns[y1[start:stop] - first] - columns[y0[start:stop] - first]
+        cumulative = numpy.zeros((stop - start, width + 1), dtype=numpy.uint32); numpy.cumsum(vertical, axis=1, out=cumulative[:, 1:])
+        sums = cumulative[:, x1] - cumulative[:, x0]; areas = numpy.outer(y1[start:stop] - y0[start:stop], x1 - x0).astype(numpy.uint32)
+        # Encre : pixel * surface <= somme locale * (1 - sensibilité), en entiers (255 x 51² x 100 tient sur 32 bits)
+        output[start:stop] = numpy.where(image[start:stop].astype(numpy.uint32) * areas * 100 <= sums * ratio, 0, 255)
+    return output
+
+def preprocess_raster(raster, deskew=True):
+    # Renvoie un nouveau raster et la matrice pixel traité -> pixel d'origine. deskew=False quand le PDF de Tesseract est posé tel quel
+    # sur la page : il ne peut suivre qu'un rectangle, pas une image cisaillée.
+    identity = fitz.Matrix(1, 1)
+    if numpy is None: return raster, identity
+    image = numpy.frombuffer(raster.samples, dtype=numpy.uint8).reshape(raster.height, raster.stride)[:, :raster.width]
+    threshold = otsu_threshold(image[::2, ::2]); slope = 0.0  # Un pixel sur quatre suffit pour l'histogramme
+    # Bords noirs blanchis d'abord : ils fausseraient la mesure d'inclinaison et le recadrage
+    left, top, right, bottom = dark_borders(image < threshold)
+    if (left, top, right, bottom) != (0, 0, raster.width, raster.height):
+        image = image.copy(); image[:top] = 255; image[bottom:] = 255; image[:, :left] = 255; image[:, right:] = 255
+    if deskew:
+        step = max(1, round(raster.dpi / ANALYSIS_DPI)); angle = estimate_skew(image[::step, ::step] < threshold)
+        if abs(angle) >= MIN_SKEW_DEGREES: slope = float(numpy.tan(numpy.radians(angle))); image = shear_columns(image, slope)
+    ink = image < threshold
+    box = content_box(ink, margin=int(raster.dpi / 10))
+    if box is None: return raster, identity  # Page blanche : rien à gagner
+    left, top, right, bottom = box; image = image[top:bottom, left:right]
+    # Réduction d'un facteur entier (moyenne de blocs k x k) tant que la hauteur d'x reste au-dessus de la cible
+    x_height = estimate_x_height(ink[top:bottom, left:right]); factor = 1
+    if x_height: factor = max(1, min(int(x_height / TARGET_X_HEIGHT), int(raster.dpi / MIN_DPI)))
+    if factor > 1:
+        height, width = image.shape[0] // factor * factor, image.shape[1] // factor * factor
+        image = (image[:height, :width].reshape(height // factor, factor, width // factor, factor).sum(axis=(1, 3), dtype=numpy.uint16) // factor ** 2).astype(numpy.uint8)
+    dpi = raster.dpi / factor
+    image = numpy.ascontiguousarray(binarize(image, max(15, int(dpi / 6)) | 1))
+    # Pixel traité -> pixel redressé (réduction, recadrage) -> pixel d'origine (cisaillement inverse)
+    matrix = fitz.Matrix(factor, 0, 0, factor, left, top) * fitz.Matrix(1, slope, 0, 1, 0, 0)
+    return Raster(image.tobytes(), image.shape[1], image.shape[0], image.shape[1], dpi), matrix
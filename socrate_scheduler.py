@@ -0,0 +1,218 @@
+# socrate_scheduler.py
+
+import os
+import time
+import heapq
+import threading
+
+# --- Dépendance optionnelle : sans psutil, mesures lues dans /proc (Linux) ; ailleurs, le nombre de fichiers simultanés reste fixe.
+# Importé à la première mesure, pas au chargement du moteur.
+psutil = False
+
+SWAP_STORM_BYTES = 4 * 1024 * 1024  # Octets échangés avec le swap par seconde au-delà desquels le système est considéré comme saturé
+
+class StabilityTracker(threading.Thread):
+    # Un seul thread surveille tous les fichiers en cours d'écriture : un tas d'échéances remplace un thread endormi par fichier.
+    # Un fichier est promu quand sa taille et sa date de modification n'ont pas bougé pendant check_interval secondes.
+    def __init__(self, on_stable, log, check_interval=1.0, max_wait=30):
+        super().__init__(daemon=True)
+        self.on_stable = on_stable; self.log = log
+        self.check_interval = check_interval; self.max_wait = max_wait
+        self.pending = {}  # chemin -> [règle, taille, mtime, première détection]
+        self.deadlines = []  # tas de (échéance, chemin), une seule échéance par fichier suivi
+        self.condition = threading.Condition(); self.stopped = False
+
+    def track(self, path, rule):
+        # Appelé depuis les événements watchdog : sans effet si le fichier est déjà suivi
+        try: stat = os.stat(path)
+        except OSError: return False
+        with self.condition:
+            if self.stopped or path in self.pending: return False
+            now = time.monotonic()
+            self.pending[path] = [rule, stat.st_size, stat.st_mtime, now]
+            heapq.heappush(self.deadlines, (now + self.check_interval, path))
+            self.condition.notify()
+        return True
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True; self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and (not self.deadlines or self.deadlines[0][0] > time.monotonic()):
+                    self.condition.wait(self.deadlines[0][0] - time.monotonic() if self.deadlines else None)
+                if self.stopped: return
+                now = time.monotonic(); due = []
+                while self.deadlines and self.deadlines[0][0] <= now: due.append(heapq.heappop(self.deadlines)[1])
+            # Les accès disque se font hors du verrou pour ne pas bloquer les événements entrants
+            for path in due: self.check(path)
+
+    def check(self, path):
+        with self.condition: entry = self.pending.get(path)
+        if entry is None: return
+        rule, size, mtime, first_seen = entry; filename = os.path.basename(path)
+        try: stat = os.stat(path)
+        except OSError:
+            with self.condition: self.pending.pop(path, None)
+            self.log(f"Le fichier '{filename}' a disparu.", "warning"); return
+        if stat.st_size > 0 and (stat.st_size, stat.st_mtime) == (size, mtime):
+            with self.condition: self.pending.pop(path, None)
+            self.log(f"Le fichier '{filename}' est stable.", "info"); self.on_stable(path, rule); return
+        if time.monotonic() - first_seen > self.max_wait:
+            with self.condition: self.pending.pop(path, None)
+            self.log(f"Le fichier '{filename}' n'est pas devenu stable. Ignoré.", "error"); return
+        with self.condition:
+            entry[1], entry[2] = stat.st_size, stat.st_mtime
+            heapq.heappush(self.deadlines, (time.monotonic() + self.check_interval, path))
+
+class MemoryBudget:
+    # Budget mémoire partagé par les fichiers en cours : chaque lot de pages réserve son estimation avant d'être envoyé au pool OCR.
+    # max_bytes = 0 : pas de limite.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes; self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, cost, timeout=None):
+        # Un lot plus gros que le budget entier passe seul, quand plus rien d'autre n'est réservé
+        with self.condition:
+            if self.max_bytes and not self.condition.wait_for(lambda: self.used == 0 or self.used + cost <= self.max_bytes, timeout): return False
+            self.used += cost
+            return True
+
+    def release(self, cost):
+        with self.condition:
+            self.used -= cost; self.condition.notify_all()
+
+    def resize(self, max_bytes):
+        # Budget ajusté par le régulateur : une baisse ne retire rien aux lots déjà réservés, une hausse réveille ceux en attente
+        with self.condition:
+            self.max_bytes = max_bytes; self.condition.notify_all()
+
+class FairShare:
+    # Partage pondéré entre règles par temps virtuel : chaque fichier servi fait avancer sa règle de pages / poids,
+    # et la règle en attente la moins avancée passe en premier. Une règle qui revient après une période sans fichier
+    # repart au niveau des règles actives : elle ne capitalise pas de crédit pendant son inactivité.
+    def __init__(self, weights):
+        self.weights = weights; self.virtual = {}; self.active = set()
+        self.lock = threading.Lock()
+
+    def pick(self, runnable, update_active=True):
+        # update_active=False : sélection restreinte (thread des petits documents), qui ne voit qu'une partie des règles en attente.
+        # Le plancher vient alors des règles actives connues, et celles absentes de la sélection ne sont pas considérées comme revenues d'inactivité.
+        if not runnable: return None
+        with self.lock:
+            still_active = [self.virtual[rule] for rule in (runnable if update_active else self.active) if rule in self.active]
+            floor = min(still_active) if still_active else None
+            for rule in runnable:
+                if floor is not None and rule not in self.active: self.virtual[rule] = max(self.virtual.get(rule, floor), floor)
+                else: self.virtual.setdefault(rule, 0.0)
+            if update_active: self.active = set(runnable)
+            # À égalité, la règle de plus fort poids l'emporte
+            return min(runnable, key=lambda rule: (self.virtual[rule], -self.weights.get(rule, 1), rule))
+
+    def charge(self, rule, pages):
+        with self.lock: self.virtual[rule] = self.virtual.get(rule, 0.0) + max(1, pages or 1) / self.weights.get(rule, 1)
+
+def _read_proc(path, keys):
+    values = {}
+    try:
+        with open(path, encoding="ascii") as f:
+            for line in f:
+                name, _, rest = line.partition(":" if path.endswith("meminfo") else " ")
+                if name in keys: values[name] = int(rest.split()[0])
+    except (OSError, ValueError): pass
+    return values
+
+def _cgroup_available():
+    # Conteneur (cgroup v2) : la limite du groupe compte plus que la mémoire de la machine
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f: limit = f.read().strip()
+        with open("/sys/fs/cgroup/memory.current") as f: current = int(f.read())
+    except (OSError, ValueError): return None
+    return None if limit == "max" else max(0, int(limit) - current)
+
+def system_load():
+    # (mémoire disponible en octets, charge CPU par cœur, octets échangés avec le swap depuis le démarrage) ; None si la mesure est impossible
+    global psutil
+    if psutil is False:
+        try: import psutil
+        except ImportError: psutil = None
+    cpus = os.cpu_count() or 1
+    if psutil:
+        swap = psutil.swap_memory()
+        available, cpu, swapped = psutil.virtual_memory().available, psutil.cpu_percent(None) / 100, swap.sin + swap.sout
+    else:
+        meminfo = _read_proc("/proc/meminfo", {"MemAvailable"}); vmstat = _read_proc("/proc/vmstat", {"pswpin", "pswpout"})
+        available = meminfo["MemAvailable"] * 1024 if "MemAvailable" in meminfo else None
+        swapped = (vmstat["pswpin"] + vmstat["pswpout"]) * 4096 if len(vmstat) == 2 else None
+        try: cpu = os.getloadavg()[0] / cpus
+        except (AttributeError, OSError): cpu = None
+    cgroup = _cgroup_available()
+    if cgroup is not None: available = cgroup if available is None else min(available, cgroup)
+    return available, cpu, swapped
+
+class ConcurrencyGovernor(threading.Thread):
+    # Nombre de fichiers traités simultanément, ajusté entre min_slots et max_slots d'après la mémoire et la charge du système :
+    # un créneau de plus tant qu'ils sont tous occupés, que des fichiers attendent et que CPU et mémoire ont de la marge ;
+    # deux fois moins quand la mémoire disponible passe sous la réserve ou que le système pagine ; plus aucun nouveau fichier
+    # sous la moitié de la réserve. Le budget mémoire des pages suit la mémoire disponible, sans dépasser budget_max_bytes.
+    def __init__(self, min_slots, max_slots, memory_budget, budget_max_bytes, reserve_bytes, backlog, log, max_cpu_load=0.9, interval=2.0, adaptive=True):
+        super().__init__(daemon=True)
+        self.min_slots = max(1, min_slots); self.max_slots = max(self.min_slots, max_slots)
+        self.memory_budget = memory_budget; self.budget_max_bytes = budget_max_bytes; self.reserve_bytes = reserve_bytes
+        self.backlog = backlog; self.log = log; self.max_cpu_load = max_cpu_load; self.interval = interval
+        self.adaptive = adaptive and system_load()[0] is not None  # Sans mesure de la mémoire, rien à réguler
+        # Limite de départ fixée une fois le mode connu : sans régulation, la valeur configurée s'applique telle quelle
+        self.limit = min(self.max_slots, max(self.min_slots, 3)) if self.adaptive else self.max_slots; self.active = 0; self.paused = False
+        self.last_swapped = None; self.available = None
+        self.condition = threading.Condition(); self.stop_event = threading.Event()
+
+    def acquire(self, stop_event, express=False):
+        # Bloque jusqu'à ce qu'un créneau se libère. Le thread des petits documents ne compte pas dans la limite, mais respecte la pause.
+        with self.condition:
+            while not stop_event.is_set():
+                if not self.paused and (express or self.active < self.limit):
+                    if not express: self.active += 1
+                    return True
+                self.condition.wait(1.0)
+        return False
+
+    def release(self, express=False):
+        with self.condition:
+            if not express: self.active -= 1
+            self.condition.notify_all()
+
+    def set_limit(self, limit, paused, reason):
+        with self.condition:
+            changed = (limit, paused) != (self.limit, self.paused); resumed = self.paused and not paused
+            self.limit, self.paused = limit, paused; self.condition.notify_all()
+        if not changed: return
+        if paused: self.log(f"Mémoire disponible très basse ({self.available // 2 ** 20} Mo) : plus aucun nouveau fichier jusqu'à ce qu'elle remonte.", "warning")
+        else: self.log(f"{'Reprise. ' if resumed else ''}Fichiers simultanés : {limit} ({reason}).", "info" if reason in ("marge disponible", "mémoire revenue") else "warning")
+
+    def step(self):
+        available, cpu, swapped = system_load(); self.available = available
+        swapping = swapped is not None and self.last_swapped is not None and swapped - self.last_swapped > SWAP_STORM_BYTES * self.interval
+        self.last_swapped = swapped
+        if available is None: return
+        # Budget des pages : ce qui est déjà réservé plus ce qui reste disponible au-delà de la réserve
+        headroom = self.memory_budget.used + max(0, available - self.reserve_bytes)
+        self.memory_budget.resize(max(1, min(self.budget_max_bytes, headroom) if self.budget_max_bytes else headroom))
+        with self.condition: limit, active = self.limit, self.active
+        if available < self.reserve_bytes / 2: self.set_limit(max(self.min_slots, limit // 2), True, "mémoire")
+        elif available < self.reserve_bytes or swapping: self.set_limit(max(self.min_slots, limit // 2), False, "swap" if swapping else "mémoire")
+        elif active >= limit and limit < self.max_slots and (cpu is None or cpu < self.max_cpu_load) and self.backlog(): self.set_limit(limit + 1, False, "marge disponible")
+        else: self.set_limit(limit, False, "mémoire revenue")
+
+    def run(self):
+        if not self.adaptive: return
+        system_load()  # Première mesure CPU de psutil : référence pour les suivantes
+        while not self.stop_event.wait(self.interval):
+            try: self.step()
+            except Exception as e: self.log(f"Régulation de la concurrence : {e}", "warning")
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition: self.condition.notify_all()
@@ -0,0 +1,181 @@
+# socrate_store.py
+
+import os
+import time
+import sqlite3
+import threading
+
+# --- États d'une tâche dans le journal ---
+JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED = "queued", "running", "done", "failed"
+
+def connect(db_path):
+    # Connexion partagée entre threads (protégée par un verrou côté appelant), en mode WAL pour les lectures concurrentes
+    connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL"); connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+class JobJournal:
+    # Journal persistant des fichiers à traiter : survit à un arrêt ou un plantage de l'application.
+    # Une tâche est identifiée par (chemin, taille, date de modification) : réenfiler un fichier en attente ne crée pas de doublon.
+    def __init__(self, db_path, max_attempts=3, retry_delay=30):
+        self.max_attempts = max_attempts; self.retry_delay = retry_delay
+        self.lock = threading.Lock(); self.db = connect(db_path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL, rule TEXT NOT NULL,
+            state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0, error TEXT,
+            created REAL NOT NULL, updated REAL NOT NULL, pages INTEGER, UNIQUE (path, size, mtime))""")
+        # Bases créées avant l'ordonnancement par taille : colonne ajoutée, nombre de pages inconnu pour les anciennes tâches
+        if "pages" not in {column[1] for column in self.db.execute("PRAGMA table_info(jobs)")}: self.db.execute("ALTER TABLE jobs ADD COLUMN pages INTEGER")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (state, next_attempt)")
+
+    def enqueue(self, path, rule, pages=None):
+        try: stat = os.stat(path)
+        except FileNotFoundError: return False
+        now = time.time()
+        # Doublon seulement tant que la tâche est en file ou en cours : un fichier terminé ou abandonné puis redéposé
+        # (même taille et même date, comme une copie de l'explorateur) repart comme une nouvelle tâche
+        with self.lock:
+            cursor = self.db.execute("INSERT INTO jobs (path, size, mtime, rule, state, created, updated, pages) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                                     "ON CONFLICT (path, size, mtime) DO UPDATE SET rule = excluded.rule, state = excluded.state, attempts = 0, next_attempt = 0, error = NULL, "
+                                     "created = excluded.created, updated = excluded.updated, pages = excluded.pages WHERE jobs.state IN (?, ?)",
+                                     (path, stat.st_size, stat.st_mtime, rule, JOB_QUEUED, now, now, pages, JOB_DONE, JOB_FAILED))
+            return cursor.rowcount > 0
+
+    @staticmethod
+    def _rules_filter(rules):
+        # Restreint une requête aux règles surveillées par ce processus (l'interface et la ligne de commande partagent la base)
+        rules = list(rules)
+        return f" AND rule IN ({', '.join('?' * len(rules))})", rules
+
+    def claim(self, rules, pick=None, shortest_first=False, max_pages=None, aging=10, unknown_pages=1000):
+        # Sélection et passage à l'état "running" dans la même transaction.
+        # pick(règles ayant une tâche prête) choisit la règle servie (partage entre règles) ; sans pick, ordre d'arrivée toutes règles confondues.
+        # shortest_first : dans la règle, le plus petit document d'abord ; une tâche gagne une page de priorité toutes les `aging` secondes d'attente.
+        # max_pages : seulement les documents d'au plus ce nombre de pages (nombre inconnu exclu).
+        now = time.time(); rules_sql, rules_args = self._rules_filter(rules)
+        where, args = f"state = ? AND next_attempt <= ?{rules_sql}", [JOB_QUEUED, now, *rules_args]
+        if max_pages is not None: where += " AND pages <= ?"; args.append(max_pages)
+        order = "COALESCE(pages, ?) - (? - created) / ?, next_attempt, id" if shortest_first else "next_attempt, id"
+        order_args = [unknown_pages, now, aging] if shortest_first else []
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                if pick:
+                    rule = pick([runnable for runnable, in self.db.execute(f"SELECT DISTINCT rule FROM jobs WHERE {where}", args)])
+                    where += " AND rule = ?"; args.append(rule)
+                row = self.db.execute(f"SELECT id, path, rule, pages FROM jobs WHERE {where} ORDER BY {order} LIMIT 1", (*args, *order_args)).fetchone()
+                if row: self.db.execute("UPDATE jobs SET state = ?, attempts = attempts + 1, updated = ? WHERE id = ?", (JOB_RUNNING, now, row[0]))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK"); raise
+        return row
+
+    def complete(self, job_id):
+        with self.lock: self.db.execute("UPDATE jobs SET state = ?, error = NULL, updated = ? WHERE id = ?", (JOB_DONE, time.time(), job_id))
+
+    def fail(self, job_id, error, retry=True):
+        # Nouvel essai avec attente exponentielle (30 s, 60 s, 120 s...) tant que le nombre maximal d'essais n'est pas atteint
+        now = time.time()
+        with self.lock:
+            attempts = self.db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            if retry and attempts < self.max_attempts:
+                self.db.execute("UPDATE jobs SET state = ?, next_attempt = ?, error = ?, updated = ? WHERE id = ?",
+                                (JOB_QUEUED, now + self.retry_delay * 2 ** (attempts - 1), error, now, job_id))
+                return True
+            self.db.execute("UPDATE jobs SET state = ?, error = ?, updated = ? WHERE id = ?", (JOB_FAILED, error, now, job_id))
+            return False
+
+    def release(self, job_id):
+        # Tâche interrompue (arrêt demandé) : remise en file sans compter l'essai
+        with self.lock: self.db.execute("UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), updated = ? WHERE id = ?", (JOB_QUEUED, time.time(), job_id))
+
+    def defer(self, job_id, until):
+        # Mode multi-nœud (fichier traité par un autre nœud, bail impossible à prendre) : remis en file jusqu'à until, sans compter l'essai
+        with self.lock: self.db.execute("UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), next_attempt = ?, updated = ? WHERE id = ?", (JOB_QUEUED, until, time.time(), job_id))
+
+    def recover(self, rules):
+        # Au démarrage, les tâches restées "running" viennent d'un arrêt brutal : on les remet en file
+        rules_sql, rules_args = self._rules_filter(rules)
+        with self.lock: return self.db.execute(f"UPDATE jobs SET state = ?, updated = ? WHERE state = ?{rules_sql}", (JOB_QUEUED, time.time(), JOB_RUNNING, *rules_args)).rowcount
+
+    def pending_count(self, rules):
+        rules_sql, rules_args = self._rules_filter(rules)
+        with self.lock: return self.db.execute(f"SELECT COUNT(*) FROM jobs WHERE state IN (?, ?){rules_sql}", (JOB_QUEUED, JOB_RUNNING, *rules_args)).fetchone()[0]
+
+    def count_by_state(self, rules):
+        rules_sql, rules_args = self._rules_filter(rules)
+        with self.lock: return dict(self.db.execute(f"SELECT state, COUNT(*) FROM jobs WHERE 1{rules_sql} GROUP BY state", rules_args).fetchall())
+
+    def next_retry_delay(self, rules):
+        rules_sql, rules_args = self._rules_filter(rules)
+        with self.lock: row = self.db.execute(f"SELECT MIN(next_attempt) FROM jobs WHERE state = ?{rules_sql}", (JOB_QUEUED, *rules_args)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def purge(self, max_age_days=90):
+        with self.lock:
+            return self.db.execute("DELETE FROM jobs WHERE state IN (?, ?) AND updated < ?", (JOB_DONE, JOB_FAILED, time.time() - max_age_days * 86400)).rowcount
+
+    def close(self):
+        with self.lock: self.db.close()
+
+class ScanManifest:
+    # Dernier état connu de chaque PDF vu par le scan : (taille, date, inode) et résultat du traitement.
+    # Au redémarrage, un fichier inchangé n'est ni rouvert ni réenfilé ; seuls les nouveaux fichiers et ceux modifiés passent au journal.
+    def __init__(self, db_path):
+        self.lock = threading.Lock(); self.db = connect(db_path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS manifest (
+            path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, inode INTEGER NOT NULL, result TEXT NOT NULL, updated REAL NOT NULL)""")
+
+    def snapshot(self, root):
+        # Tous les fichiers connus sous root, chargés d'un coup : le scan compare ensuite en mémoire, sans requête par fichier
+        prefix = os.path.join(root, "")
+        with self.lock:
+            rows = self.db.execute("SELECT path, size, mtime, inode FROM manifest WHERE path >= ? AND path < ?", (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))).fetchall()
+        return {path: (size, mtime, inode) for path, size, mtime, inode in rows}
+
+    def record(self, path, result):
+        try: stat = os.stat(path)
+        except FileNotFoundError: return False  # Original déplacé ou écrasé : son nouvel emplacement sera vu par le scan
+        with self.lock:
+            self.db.execute("INSERT INTO manifest (path, size, mtime, inode, result, updated) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+                            "size = excluded.size, mtime = excluded.mtime, inode = excluded.inode, result = excluded.result, updated = excluded.updated",
+                            (path, stat.st_size, stat.st_mtime, stat.st_ino, result, time.time()))
+        return True
+
+    def forget_missing(self, root, seen):
+        # Fichiers supprimés depuis le dernier scan : retirés pour que la table ne grossisse pas indéfiniment
+        missing = [(path,) for path in self.snapshot(root) if path not in seen]
+        with self.lock: self.db.executemany("DELETE FROM manifest WHERE path = ?", missing)
+        return len(missing)
+
+    def close(self):
+        with self.lock: self.db.close()
+
+class StateStore:
+    # Compteurs [COMPTEUR] par règle : incrément atomique en base (une transaction par valeur), sans réécrire de fichier JSON
+    def __init__(self, db_path, legacy_state=None):
+        self.lock = threading.Lock(); self.db = connect(db_path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS counters (rule TEXT PRIMARY KEY, value INTEGER NOT NULL, last_used TEXT NOT NULL)")
+        # Reprise des compteurs de l'ancien state.json lors du premier lancement
+        if legacy_state and not self.db.execute("SELECT COUNT(*) FROM counters").fetchone()[0]:
+            with self.lock:
+                self.db.executemany("INSERT OR IGNORE INTO counters (rule, value, last_used) VALUES (?, ?, ?)",
+                                    [(rule, int(state.get("value", 0)), state.get("last_used", "1970-01-01")) for rule, state in legacy_state.get("counters", {}).items()])
+
+    def next_counter(self, rule_path, today, should_reset):
+        # should_reset(dernière date d'utilisation "AAAA-MM-JJ") décide de la remise à 1 ; lecture et écriture dans la même transaction
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT value, last_used FROM counters WHERE rule = ?", (rule_path,)).fetchone()
+                value, last_used = row if row else (0, "1970-01-01")
+                value = 1 if should_reset(last_used) else value + 1
+                self.db.execute("INSERT INTO counters (rule, value, last_used) VALUES (?, ?, ?) ON CONFLICT (rule) DO UPDATE SET value = excluded.value, last_used = excluded.last_used",
+                                (rule_path, value, today))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK"); raise
+        return value
+
+    def close(self):
+        with self.lock: self.db.close()
@@ -0,0 +1,47 @@
+# socrate_textlayer.py
+# Couche texte invisible des pages OCR : un seul flux de contenu par page, au lieu d'un insert_text (et d'un objet texte) par mot
+
+import fitz  # PyMuPDF
+
+# "textwriter" : couche écrite à partir des mots reconnus ; "tesseract" : PDF texte seul produit par Tesseract, fusionné tel quel
+TEXT_LAYER_OPTIONS = ["textwriter", "tesseract"]
+FONT_NAME = "helv"  # Helvetica, police de base PDF : rien à embarquer, une seule ressource par page
+_font = fitz.Font(FONT_NAME)
+
+def overlaps_existing_text(rect, text_rects):
+    center = fitz.Point((rect.x0 + rect.x1) / 2, (rect.y0 + rect.y1) / 2)
+    return any(center in text_rect for text_rect in text_rects)
+
+def _num(value):
+    return format(round(value, 3), "g")
+
+def write_text_layer(page, lines, text_rects=None):
+    # lines : une liste de mots (x0, y0, x1, y1, texte) par ligne Tesseract, en coordonnées de la page affichée.
+    # Un bloc BT/ET unique, en mode de rendu 3 (invisible) : chaque mot ne coûte qu'une matrice de texte et une chaîne.
+    derotate = page.derotation_matrix; to_pdf = derotate * ~page.transformation_matrix
+    operators = []
+    for words in lines:
+        if text_rects: words = [word for word in words if not overlaps_existing_text(fitz.Rect(word[:4]) * derotate, text_rects)]
+        if not words: continue
+        # Ligne de base et taille communes à la ligne : l'extraction et la sélection suivent l'ordre de lecture
+        heights = sorted(y1 - y0 for _, y0, _, y1, _ in words); bottoms = sorted(y1 for *_, y1, _ in words)
+        fontsize = max(1.0, heights[len(heights) // 2] * 0.8); baseline = bottoms[len(bottoms) // 2]
+        for x0, _, x1, _, text in words:
+            # Mot étiré à la largeur de sa boîte : la surbrillance d'une recherche tombe sur le mot scanné
+            natural_width = _font.text_length(text, fontsize=fontsize); stretch = (x1 - x0) / natural_width if natural_width else 1
+            matrix = fitz.Matrix(fontsize * stretch, 0, 0, -fontsize, x0, baseline) * to_pdf
+            operators.append(f"{' '.join(map(_num, matrix))} Tm <{text.encode('cp1252', 'replace').hex()}> Tj")
+    if not operators: return 0
+    # La police est déclarée une fois dans les ressources de la page ; le contenu existant est isolé (q/Q) avant l'ajout
+    page.insert_font(fontname=FONT_NAME)
+    if not page.is_wrapped: page.wrap_contents()
+    document = page.parent; xref = document.get_new_xref(); document.update_object(xref, "<<>>")
+    document.update_stream(xref, f"q BT 3 Tr /{FONT_NAME} 1 Tf\n{chr(10).join(operators)}\nET Q".encode("latin-1"))
+    document.xref_set_key(page.xref, "Contents", f"[{' '.join(f'{content} 0 R' for content in page.get_contents() + [xref])}]")
+    return len(operators)
+
+def merge_text_pdf(page, pdf_bytes, rect):
+    # PDF "textonly" de Tesseract : sa page couvre exactement le raster reconnu, posée sur rect (coordonnées affichées).
+    # show_pdf_page attend le rectangle de la page non tournée et la rotation à appliquer.
+    with fitz.open("pdf", pdf_bytes) as source:
+        page.show_pdf_page(fitz.Rect(rect) * page.derotation_matrix, source, 0, rotate=page.rotation, keep_proportion=False)